@@ -0,0 +1,22 @@
+import functools
+
+from pygments.formatters import LatexFormatter
+
+
+@functools.lru_cache(maxsize=1)
+def shared_formatter() -> LatexFormatter:
+    """Return the LaTeX formatter shared by code blocks and the document header."""
+    # Configure LaTeX formatter
+    # Options:
+    # - style: color scheme (default is good, can also use 'monokai', 'friendly', etc.)
+    # - linenos: False (no line numbers based on user preference)
+    # - verboptions: additional options for Verbatim environment (e.g., fontsize)
+    return LatexFormatter(
+        style="default", linenos=False, verboptions="fontsize=\\small"
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def style_defs() -> str:
+    """Return Pygments style definitions for code highlighting."""
+    return shared_formatter().get_style_defs()
@@ -3,73 +3,113 @@ import os
 import click
 import subprocess
 import shutil
+from pathlib import Path
 
 from .parser import MarkdownBeamerParser
 from .generator import BeamerGenerator
 
 
+# latexmk configuration written to the output directory
+LATEXMKRC = """$max_repeat = 3;
+$bibtex_use = 0;
+"""
+
+
+def _status(*messages: str) -> None:
+    """Write status messages to stderr in a single call."""
+    sys.stderr.write("\n".join(messages) + "\n")
+    sys.stderr.flush()
+
+
+def _deliver_pdf(source: Path, destination: Path) -> None:
+    """Copy the PDF to its destination, replacing it atomically.
+
+    The copy is a separate file, so the next compile, which rewrites the
+    build output in place, never truncates the delivered PDF.
+    """
+    temp_destination = destination.with_name(destination.name + ".tmp")
+    shutil.copy2(source, temp_destination)
+    os.replace(temp_destination, destination)
+
+
 @click.command()
 @click.argument("markdown_file", type=click.Path(exists=True, readable=True))
 @click.option("--no-cache", is_flag=True, help="Disable reading from cache (writing to cache still enabled)")
-def main(markdown_file, no_cache):
+@click.option(
+    "-j",
+    "--jobs",
+    type=int,
+    default=None,
+    help="Number of parallel workers for slide generation (default: all CPUs)",
+)
+def main(markdown_file, no_cache, jobs):
     """Convert markdown file to LaTeX beamer presentation."""
 
     # Create output directory based on input filename
-    base_name = os.path.splitext(os.path.basename(markdown_file))[0]
-    output_dir = f"{base_name}-autoslide"
+    markdown_path = Path(markdown_file).absolute()
+    base_name = markdown_path.stem
+    output_path = Path(f"{base_name}-autoslide")
+    output_dir = str(output_path)
 
     # Create output directory if it doesn't exist
-    os.makedirs(output_dir, exist_ok=True)
+    output_path.mkdir(parents=True, exist_ok=True)
 
-    # Output filename
-    output_file = os.path.join(output_dir, f"{base_name}.tex")
+    # Cap latexmk passes and skip bibliography runs (only if not customized)
+    latexmkrc_path = output_path / ".latexmkrc"
+    if not latexmkrc_path.exists():
+        latexmkrc_path.write_text(LATEXMKRC, encoding="utf-8")
 
-    # Read the markdown file
-    with open(markdown_file, "r", encoding="utf-8") as f:
-        markdown_content = f.read()
+    # Output filenames
+    output_file = output_path / f"{base_name}.tex"
+    pdf_source = output_path / f"{base_name}.pdf"
+    pdf_destination = markdown_path.parent / f"{base_name}.pdf"
 
-    # Parse and generate
-    parser = MarkdownBeamerParser(markdown_file, output_dir)
-    slides = parser.parse(markdown_content)
+    # Parse the markdown file line by line, then generate
+    parser = MarkdownBeamerParser(markdown_file, output_dir, no_cache=no_cache)
+    with open(markdown_file, "r", encoding="utf-8", buffering=1 << 20) as f:
+        slides = parser.parse_stream(f)
 
-    print(f"Parsed {len(slides)} slides", file=sys.stderr)
+    _status(f"Parsed {len(slides)} slides")
 
     generator = BeamerGenerator(output_dir, no_cache=no_cache)
-    latex_output = generator.generate_beamer(slides, "My Presentation")
+    latex_output = generator.generate_beamer(
+        slides, "My Presentation", max_workers=jobs
+    )
 
-    # Write output to file
-    with open(output_file, "w", encoding="utf-8") as f:
+    # Write output to a temporary file and move it into place atomically
+    temp_output_file = output_path / f"{base_name}.tex.tmp"
+    with open(temp_output_file, "w", encoding="utf-8") as f:
         f.write(latex_output)
+    os.replace(temp_output_file, output_file)
 
-    print(f"Generated {output_file}", file=sys.stderr)
-
-    # Compile LaTeX to PDF using latexmk
-    print(f"Compiling LaTeX to PDF...", file=sys.stderr)
+    # Compile LaTeX to PDF using latexmk, which skips the passes itself when
+    # neither the source nor the images it includes changed
+    _status(f"Generated {output_file}", "Compiling LaTeX to PDF...")
     try:
         result = subprocess.run(
-            ["latexmk", "-xelatex", "-interaction=nonstopmode", f"{base_name}.tex"],
+            ["latexmk", "-pdfxe", "-interaction=nonstopmode", f"{base_name}.tex"],
             cwd=output_dir,
-            capture_output=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
             text=True,
             check=True
         )
-        print(f"LaTeX compilation successful", file=sys.stderr)
+        _status("LaTeX compilation successful")
     except subprocess.CalledProcessError as e:
-        print(f"LaTeX compilation failed: {e}", file=sys.stderr)
-        print(f"stdout: {e.stdout}", file=sys.stderr)
-        print(f"stderr: {e.stderr}", file=sys.stderr)
+        log_file = output_path / f"{base_name}.log"
+        _status(
+            f"LaTeX compilation failed: {e}",
+            f"stderr: {e.stderr}",
+            f"See {log_file} for details",
+        )
         return
 
     # Copy PDF back to original directory
-    pdf_source = os.path.join(output_dir, f"{base_name}.pdf")
-    markdown_dir = os.path.dirname(os.path.abspath(markdown_file))
-    pdf_destination = os.path.join(markdown_dir, f"{base_name}.pdf")
-
-    if os.path.exists(pdf_source):
-        shutil.copy2(pdf_source, pdf_destination)
-        print(f"PDF copied to {pdf_destination}", file=sys.stderr)
+    if pdf_source.exists():
+        _deliver_pdf(pdf_source, pdf_destination)
+        _status(f"PDF copied to {pdf_destination}")
     else:
-        print(f"PDF file not found at {pdf_source}", file=sys.stderr)
+        _status(f"PDF file not found at {pdf_source}")
 
 
 if __name__ == "__main__":
@@ -1,35 +1,120 @@
+import os
+import functools
+from collections import OrderedDict
+from typing import List, Tuple
+
 from pygments import highlight
 from pygments.lexers import get_lexer_by_name, TextLexer
-from pygments.formatters import LatexFormatter
 
+from ._pygments import shared_formatter
+from .hashing import fast_hash
+
+
+@functools.lru_cache(maxsize=32)
+def _lexer(language: str):
+    """Return a (cached) Pygments lexer for the given language."""
+    try:
+        # Get the appropriate lexer for the language
+        return get_lexer_by_name(language, stripall=True)
+    except Exception:
+        # Fallback to plain text if language is not recognized
+        return TextLexer()
+
+
+# In-memory LRU cache of highlighted code, keyed by content hash
+_CODE_CACHE_SIZE = 256
+_code_cache = OrderedDict()
 
-def format_code(content: str, language: str) -> str:
+
+def _code_hash(content: str, language: str) -> str:
+    """Generate a deterministic hash for a code block."""
+    return fast_hash(language + "\0" + content)
+
+
+def format_code(content: str, language: str, cache_dir: str = None) -> str:
     """Format code block using Pygments to generate LaTeX.
 
     Args:
         content: The code content
         language: The programming language for syntax highlighting
+        cache_dir: Optional directory to persist highlighted code in
 
     Returns:
         LaTeX code with syntax highlighting
     """
-    try:
-        # Get the appropriate lexer for the language
-        lexer = get_lexer_by_name(language, stripall=True)
-    except Exception:
-        # Fallback to plain text if language is not recognized
-        lexer = TextLexer()
+    key = _code_hash(content, language)
+    latex_code = _cached_code(key, cache_dir)
 
-    # Configure LaTeX formatter
-    # Options:
-    # - style: color scheme (default is good, can also use 'monokai', 'friendly', etc.)
-    # - linenos: False (no line numbers based on user preference)
-    # - verboptions: additional options for Verbatim environment (e.g., fontsize)
-    formatter = LatexFormatter(
-        style="default", linenos=False, verboptions="fontsize=\\small"
-    )
+    if latex_code is None:
+        # Generate LaTeX code
+        latex_code = highlight(content, _lexer(language), shared_formatter())
+        _store_code(key, latex_code, cache_dir)
 
-    # Generate LaTeX code
-    latex_code = highlight(content, lexer, formatter)
+    return latex_code
 
+
+def format_code_batch(code_blocks: List[Tuple[str, str]], cache_dir: str = None) -> None:
+    """Highlight all uncached code blocks up front.
+
+    Each distinct block is highlighted on its own, exactly as format_code
+    would, so lexer state never carries over between blocks. Results are
+    placed in the code cache, so later format_code calls are lookups.
+
+    Args:
+        code_blocks: List of (content, language) tuples
+        cache_dir: Optional directory to persist highlighted code in
+    """
+    pending = {}
+    for content, language in code_blocks:
+        key = _code_hash(content, language)
+        if key not in pending and _cached_code(key, cache_dir) is None:
+            pending[key] = (content, language)
+
+    for key, (content, language) in pending.items():
+        latex_code = highlight(content, _lexer(language), shared_formatter())
+        _store_code(key, latex_code, cache_dir)
+
+
+def _cached_code(key: str, cache_dir: str = None):
+    """Look up highlighted code in the in-memory and on-disk caches."""
+    # Check in-memory cache first
+    if key in _code_cache:
+        _code_cache.move_to_end(key)
+        return _code_cache[key]
+
+    # Check on-disk cache
+    if not cache_dir:
+        return None
+    cache_path = os.path.join(cache_dir, f"{key}.tex")
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            latex_code = f.read()
+    except OSError:
+        return None
+
+    _remember_code(key, latex_code)
     return latex_code
+
+
+def _store_code(key: str, latex_code: str, cache_dir: str = None) -> None:
+    """Store highlighted code in the in-memory and on-disk caches."""
+    _remember_code(key, latex_code)
+
+    if cache_dir:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(os.path.join(cache_dir, f"{key}.tex"), "w", encoding="utf-8") as f:
+                f.write(latex_code)
+        except OSError:
+            # Ignore write errors - caching is best effort
+            pass
+
+
+def _remember_code(key: str, latex_code: str) -> None:
+    """Add an entry to the in-memory LRU cache."""
+    _code_cache[key] = latex_code
+    _code_cache.move_to_end(key)
+    if len(_code_cache) > _CODE_CACHE_SIZE:
+        _code_cache.popitem(last=False)
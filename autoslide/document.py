@@ -1,12 +1,9 @@
-def generate_header(title: str) -> str:
-    """Generate LaTeX document header."""
-    # Get Pygments style definitions for code highlighting
-    from pygments.formatters import LatexFormatter
+import functools
+
+from ._pygments import style_defs
 
-    pygments_style = LatexFormatter(style="default").get_style_defs()
 
-    return (
-        r"""\documentclass[aspectratio=169,t]{beamer}
+_HEADER_PRE = r"""\documentclass[aspectratio=169,t]{beamer}
 % Theme and font setup
 \usetheme{default}
 \usepackage{graphicx}
@@ -72,8 +69,8 @@ def generate_header(title: str) -> str:
 \usepackage{fancyvrb}
 \usepackage{color}
 """
-        + pygments_style
-        + r"""
+
+_HEADER_POST = r"""
 \setlength{\parskip}{1.5em}
 \setlength{\parindent}{0pt}
 \setlength{\abovedisplayskip}{0pt}
@@ -81,7 +78,15 @@ def generate_header(title: str) -> str:
 \setlength{\abovedisplayshortskip}{0pt}
 \setlength{\belowdisplayshortskip}{0pt}
 \begin{document}"""
-    )
+
+
+@functools.lru_cache(maxsize=16)
+def generate_header(title: str, use_pygments: bool = True) -> str:
+    """Generate LaTeX document header, with the Pygments style definitions if use_pygments."""
+    # Get Pygments style definitions for code highlighting
+    pygments_style = style_defs() if use_pygments else ""
+
+    return f"{_HEADER_PRE}{pygments_style}{_HEADER_POST}"
 
 
 def generate_footer() -> str:
@@ -6,50 +6,93 @@ including complex annotation placement algorithms that avoid overlaps and fit wi
 """
 
 import re
+import io
 import sys
+import json
 import tempfile
 import os
 import subprocess
 import shutil
-from typing import List, Dict, Tuple
+import threading
+from bisect import bisect_left, bisect_right, insort
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Tuple
 from .models import Block
+from .hashing import fast_hash
 
+# XeLaTeX passes needed for tikzmark positions to settle
+MEASUREMENT_PASSES = 2
 
-def format_annotated_equation(block: Block, has_columns: bool = False, node_counter: int = 0, output_dir: str = ".") -> Tuple[str, int]:
-    """Format an annotated equation with tikzmarknode annotations."""
-    equation = block.metadata["equation"]
-    annotations = block.metadata["annotations"]
+# In-memory cache of measurements, keyed by measurement_cache_key
+_measurement_cache = {}
 
-    # Parse the equation (remove $$ markers but preserve internal spacing)
-    equation_content = equation.strip()
-    if equation_content.startswith("$$") and equation_content.endswith("$$"):
-        # Remove $$ from first and last lines while preserving internal formatting
-        lines = equation_content.split("\n")
-        if len(lines) == 1:
-            # Single line equation
-            equation_content = lines[0][2:-2]
-        else:
-            # Multi-line equation
-            lines[0] = lines[0][2:]  # Remove $$ from first line
-            lines[-1] = lines[-1][:-2]  # Remove $$ from last line
-            equation_content = "\n".join(lines)
+# Package part of the measurement preamble. It ends at \endofdump, so it
+# can be precompiled into a format with mylatexformat; fonts are loaded
+# after it, since XeTeX cannot dump system fonts.
+_MEASUREMENT_PACKAGES = r"""\documentclass[aspectratio=169,t]{beamer}
+\usetheme{default}
+\usepackage{graphicx}
+\usepackage{xcolor}
+\usepackage[para]{footmisc}
+\usepackage{amsmath}
+\usepackage{tikz}
+\usetikzlibrary{tikzmark,calc,positioning}
+\usepackage{colortbl}
+\usepackage{array}
+\usepackage{booktabs}
+\csname endofdump\endcsname
+"""
 
-    # Parse new annotation format: [[ exact string ]] Label
-    annotation_specs = []
-    if annotations.strip():
-        for line in annotations.split("\n"):
-            line = line.strip()
-            if not line:
-                continue
+# Savebox name suffixes for annotations 1, 2, 3, ... (A, B, C, ...), as
+# macro names cannot contain digits
+_SAVEBOX_LETTERS = tuple(chr(ord("A") + i) for i in range(26))
+
+# Measures the size of one annotation text
+_MEASURE_ANNOTATION_TEMPLATE = r"""
+% Measure annotation {i}: {label}
+\newsavebox{{\measurebox{letter}}}
+\sbox{{\measurebox{letter}}}{{\scriptsize {label}}}
+\typeout{{ANNOTATION{i}: width=\the\wd\measurebox{letter}, height=\the\ht\measurebox{letter}}}
+"""
+
+# TikZ code for one annotation above the equation: highlight, bar, line and text
+_ABOVE_ANNOTATION_TEMPLATE = r"""    %above annotation {pos}
+\path[fill=ncblue!15,draw=none,line width=0pt] ({node_name}.north west) -- ({node_name}.north east) -- ([yshift=13pt]{node_name}.base east) -- ([yshift=13pt]{node_name}.base west) -- cycle;
+    \draw[ncblue, line width=0.4mm] ([yshift=13pt]{node_name}.base west) -- ([yshift=13pt]{node_name}.base east);
+    \draw[ncblue,] ([yshift=13pt]{node_name}.base) -- ([yshift={height}pt]{node_name}.base);
+    \node[above={reduced_height}pt of {node_name}.base,anchor={anchor},inner sep=0,outer sep=0,xshift={xshift},yshift=3pt,text=ncblue] {{\scriptsize {text}}};
+"""
+
+# TikZ code for one annotation below the equation
+_BELOW_ANNOTATION_TEMPLATE = r"""    %below annotation {pos}
+\path[fill=ncblue!15,draw=none,line width=0pt] ({node_name}.south west) -- ({node_name}.south east) -- ([yshift=-8pt]{node_name}.base east) -- ([yshift=-8pt]{node_name}.base west) -- cycle;
+    \draw[ncblue, line width=0.4mm] ([yshift=-8pt]{node_name}.base west) -- ([yshift=-8pt]{node_name}.base east);
+    \draw[ncblue,] ([yshift=-8pt]{node_name}.base) -- ([yshift=-{height}pt]{node_name}.base);
+    \node[below={height}pt of {node_name}.base,anchor={anchor},inner sep=0,outer sep=0,xshift={xshift},yshift=-3pt,text=ncblue] {{\scriptsize {text}}};
+"""
+
+# Precompiled measurement format per cache directory (None if unavailable)
+_measurement_formats = {}
+_measurement_format_lock = threading.Lock()
+
+# Node name inside a tikzmarknode wrapper, e.g. ]{node3}
+_NODE_NAME_RE = re.compile(r"\]\{node\d+\}")
+
+# Measurements written to the LaTeX log via \typeout
+_BASELINE_RE = re.compile(r"BASELINEPOS: x=([0-9.-]+)pt, y=([0-9.-]+)pt")
+_ANNOTATION_MEASURE_RE = re.compile(
+    r"ANNOTATION(\d+): width=([0-9.]+)pt, height=([0-9.]+)pt"
+)
+# Format: NODEPOS1: x=123.456pt, y=789.012pt (no space before pt)
+_NODEPOS_RE = re.compile(r"NODEPOS(\d+): x=([0-9.-]+)pt, y=([0-9.-]+)pt")
 
-            # Match [[ exact string ]] Label format
-            match = re.match(r"^\[\[\s*(.*)\s*\]\]\s+(.*)$", line)
-            if match:
-                exact_string = match.group(
-                    1
-                ).strip()  # Trim edges but keep internal whitespace
-                label = match.group(2).strip()
-                annotation_specs.append((exact_string, label))
+
+def format_annotated_equation(block: Block, has_columns: bool = False, node_counter: int = 0, output_dir: str = ".", cache_dir: str = None) -> Tuple[str, int]:
+    """Format an annotated equation with tikzmarknode annotations.
+
+    If cache_dir is given, LaTeX measurements are cached there across runs.
+    """
+    equation_content, annotation_specs = parse_annotated_equation(block)
 
     # If no annotations, render as simple equation
     if not annotation_specs:
@@ -62,7 +105,7 @@ def format_annotated_equation(block: Block, has_columns: bool = False, node_coun
 
     # Determine optimal placement for annotations
     above_placements, below_placements = determine_annotation_placement(
-        annotated_equation, annotation_specs, node_names, has_columns, node_counter, output_dir
+        annotated_equation, annotation_specs, node_names, has_columns, node_counter, output_dir, cache_dir
     )
 
     # Convert placements to old format for existing tikzpicture generation
@@ -96,7 +139,7 @@ def format_annotated_equation(block: Block, has_columns: bool = False, node_coun
         )
 
         # Add annotation lines and text (background fill is now handled by tikzmarknode)
-        latex_parts.extend(tikz_code)
+        latex_parts.append(tikz_code)
 
         # Add space below for below annotations (convert from pt to em: 1em ≈ 12pt)
         if below_space > 0:
@@ -115,11 +158,64 @@ def format_annotated_equation(block: Block, has_columns: bool = False, node_coun
     return "\n".join(latex_parts), node_counter
 
 
+def parse_annotated_equation(block: Block) -> Tuple[str, List[Tuple[str, str]]]:
+    """Extract the equation content and (exact_string, label) annotations of a block."""
+    equation = block.metadata["equation"]
+    annotations = block.metadata["annotations"]
+
+    # Parse the equation (remove $$ markers but preserve internal spacing)
+    equation_content = equation.strip()
+    if equation_content.startswith("$$") and equation_content.endswith("$$"):
+        # Remove $$ from first and last lines while preserving internal formatting
+        lines = equation_content.split("\n")
+        if len(lines) == 1:
+            # Single line equation
+            equation_content = lines[0][2:-2]
+        else:
+            # Multi-line equation
+            lines[0] = lines[0][2:]  # Remove $$ from first line
+            lines[-1] = lines[-1][:-2]  # Remove $$ from last line
+            equation_content = "\n".join(lines)
+
+    # Parse new annotation format: [[ exact string ]] Label
+    annotation_specs = []
+    if annotations.strip():
+        for line in annotations.split("\n"):
+            line = line.strip()
+            if not line:
+                continue
+
+            # Match [[ exact string ]] Label format
+            spec = parse_annotation_line(line)
+            if spec:
+                annotation_specs.append(spec)
+
+    return equation_content, annotation_specs
+
+
+def parse_annotation_line(line: str):
+    """Parse a stripped "[[ exact string ]] Label" line into (exact_string, label).
+
+    The exact string ends at the last "]]" that is followed by whitespace, so it
+    may itself contain "]]". Returns None if the line is not an annotation.
+    """
+    if not line.startswith("[["):
+        return None
+    end = line.rfind("]]")
+    while end >= 2 and not (end + 2 < len(line) and line[end + 2].isspace()):
+        end = line.rfind("]]", 0, end + 1)
+    if end < 2:
+        return None
+    # Trim edges but keep internal whitespace
+    exact_string = line[2:end].strip()
+    label = line[end + 2 :].strip()
+    return exact_string, label
+
+
 def create_tikzmarknode_equation_new(
     equation_content: str, annotation_specs: List[Tuple[str, str]], node_counter: int
 ) -> Tuple[str, Dict[int, str], int]:
     """Create equation with tikzmarknode wrappers based on exact string matching."""
-    result = equation_content
     node_names = {}  # Map annotation position to node name
 
     # Process annotations in order from longest to shortest to avoid substring conflicts
@@ -128,45 +224,29 @@ def create_tikzmarknode_equation_new(
         enumerate(annotation_specs, 1), key=lambda x: len(x[1][0]), reverse=True
     )
 
+    # Sorted, non-overlapping (start, end) spans of already wrapped strings,
+    # in coordinates of the original equation, with their wrapper text
+    span_starts = []
+    span_ends = []
+    span_wrappers = []
+
     for i, (exact_string, label) in sorted_specs:
         # Find the first occurrence of the exact string that's not inside tikzmarknode
-        pos = result.find(exact_string)
-
-        # Check if this match is inside an existing tikzmarknode wrapper
-        while pos != -1:
-            # Look backwards from pos to see if we're inside a tikzmarknode
-            before_match = result[:pos]
-            # Find the last tikzmarknode opening before this position (including the configuration)
-            last_node_start = before_match.rfind("\\tikzmarknode[")
-            if last_node_start != -1:
-                # Find the corresponding closing brace
-                brace_count = 0
-                inside_tikzmarknode = False
-                for j in range(
-                    last_node_start + len("\\tikzmarknode{"),
-                    len(before_match) + len(exact_string),
-                ):
-                    if j >= len(result):
-                        break
-                    char = result[j]
-                    if char == "{":
-                        brace_count += 1
-                        if brace_count == 1:  # This is the content opening brace
-                            content_start = j + 1
-                    elif char == "}":
-                        brace_count -= 1
-                        if brace_count == 0:  # This closes the content
-                            content_end = j
-                            # Check if our match is within this tikzmarknode content
-                            if content_start <= pos < content_end:
-                                inside_tikzmarknode = True
-                            break
-
-                if inside_tikzmarknode:
-                    # Look for next occurrence after this tikzmarknode
-                    pos = result.find(exact_string, pos + len(exact_string))
-                    continue
-
+        search_from = 0
+        while True:
+            pos = equation_content.find(exact_string, search_from)
+            if pos == -1:
+                break
+            # Check whether this match overlaps an existing tikzmarknode wrapper
+            idx = bisect_right(span_starts, pos)
+            if idx > 0 and span_ends[idx - 1] > pos:
+                # Match starts inside a wrapper, continue after it
+                search_from = span_ends[idx - 1]
+                continue
+            if idx < len(span_starts) and span_starts[idx] < pos + len(exact_string):
+                # Match runs into the next wrapper
+                search_from = pos + 1
+                continue
             # This position is valid (not inside tikzmarknode)
             break
 
@@ -180,13 +260,23 @@ def create_tikzmarknode_equation_new(
         node_name = f"node{node_counter}"
         node_names[i] = node_name
 
-        # Replace the exact string with tikzmarknode wrapper that includes background fill
-        before = result[:pos]
-        after = result[pos + len(exact_string) :]
+        # Wrap the exact string with tikzmarknode wrapper that includes background fill
         wrapped = f"\\tikzmarknode[fill=ncblue!15,inner sep=1pt,outer sep=0pt]{{{node_name}}}{{{exact_string}\\mathstrut}}"
-        result = before + wrapped + after
+        idx = bisect_right(span_starts, pos)
+        span_starts.insert(idx, pos)
+        span_ends.insert(idx, pos + len(exact_string))
+        span_wrappers.insert(idx, wrapped)
 
-    return result, node_names, node_counter
+    # Stitch the equation together in a single pass
+    parts = []
+    current = 0
+    for start, end, wrapped in zip(span_starts, span_ends, span_wrappers):
+        parts.append(equation_content[current:start])
+        parts.append(wrapped)
+        current = end
+    parts.append(equation_content[current:])
+
+    return "".join(parts), node_names, node_counter
 
 
 def determine_annotation_placement(
@@ -196,6 +286,7 @@ def determine_annotation_placement(
     has_columns: bool = False,
     node_counter: int = 0,
     output_dir: str = ".",
+    cache_dir: str = None,
 ) -> Tuple[Dict[int, Tuple[float, str]], Dict[int, Tuple[float, str]]]:
     """Determine optimal placement for annotations using bounding box analysis.
 
@@ -225,7 +316,7 @@ def determine_annotation_placement(
     try:
         bounding_boxes, node_positions, node_shifts = (
             measure_annotation_bounding_boxes(
-                equation_with_nodes, annotation_specs, node_names, node_counter, output_dir, has_columns
+                equation_with_nodes, annotation_specs, node_names, node_counter, output_dir, has_columns, cache_dir
             )
         )
     except Exception as e:
@@ -256,9 +347,14 @@ def measure_annotation_bounding_boxes(
     node_counter: int,
     output_dir: str = ".",
     has_columns: bool = False,
+    cache_dir: str = None,
 ) -> Tuple[Dict[int, Tuple[float, float]], Dict[int, float], Dict[int, float]]:
     """Measure bounding boxes of annotation text and tikzmarknode positions using LaTeX.
 
+    If cache_dir is given, results are stored there as JSON keyed by the
+    equation (with node names normalized), the annotations and the layout,
+    and reused instead of running LaTeX again.
+
     Returns:
         Tuple of (bounding_boxes, node_positions, node_shifts) where:
         - bounding_boxes: Dict mapping annotation index -> (width_pt, height_pt)
@@ -271,6 +367,20 @@ def measure_annotation_bounding_boxes(
     import re
     import shutil
 
+    # Reuse a previous measurement of the same equation if available
+    cache_key = measurement_cache_key(
+        equation_with_nodes, annotation_specs, has_columns
+    )
+    if cache_key in _measurement_cache:
+        return _measurement_cache[cache_key]
+    cache_path = None
+    if cache_dir:
+        cache_path = os.path.join(cache_dir, f"measurement-{cache_key}.json")
+        cached = load_cached_measurements(cache_path)
+        if cached is not None:
+            _measurement_cache[cache_key] = cached
+            return cached
+
     # Create a temporary directory for LaTeX compilation within the output directory
     temp_dir = tempfile.mkdtemp(dir=output_dir)
 
@@ -289,26 +399,22 @@ def measure_annotation_bounding_boxes(
         with open(os.path.join(temp_dir, "measurement.nav"), "w") as f:
             f.write("")
 
-        # Run latexmk with XeLaTeX to compile and measure (handles multiple runs automatically)
-        result = subprocess.run(
-            ["latexmk", "-xelatex", "-interaction=nonstopmode", "measurement.tex"],
-            capture_output=True,
-            text=True,
-            cwd=temp_dir,
-        )
+        # Start from the precompiled package format if one is available
+        format_name = measurement_format(cache_dir)
+        returncode, output = run_measurement_passes(temp_dir, cache_dir, format_name)
+        if returncode != 0 and format_name is not None:
+            # The format may be stale (e.g. after a TeX update), retry without it
+            discard_measurement_format(cache_dir, format_name)
+            returncode, output = run_measurement_passes(temp_dir)
 
-        if result.returncode != 0:
+        if returncode != 0:
             raise RuntimeError(
-                f"LaTeX compilation failed with return code {result.returncode}, see {temp_dir} for details.\n"
+                f"LaTeX compilation failed with return code {returncode}, see {temp_dir} for details.\n"
             )
 
-        # Parse measurements from log file
-        log_path = os.path.join(temp_dir, "measurement.log")
-
-        # Debug output removed
-
-        bounding_boxes, node_positions, node_shifts = (
-            parse_measurements_from_log(log_path, len(annotation_specs))
+        # Parse measurements from the terminal output of the last pass
+        bounding_boxes, node_positions, node_shifts = parse_measurements(
+            output.splitlines(), len(annotation_specs)
         )
 
         # Debug: print measurements (only if verbose mode enabled)
@@ -316,6 +422,12 @@ def measure_annotation_bounding_boxes(
         # print(f"Debug: Measured node positions: {node_positions}", file=sys.stderr)
         # print(f"Debug: Measured node shifts: {node_shifts}", file=sys.stderr)
 
+        _measurement_cache[cache_key] = (bounding_boxes, node_positions, node_shifts)
+        if cache_path:
+            save_cached_measurements(
+                cache_path, bounding_boxes, node_positions, node_shifts
+            )
+
         return bounding_boxes, node_positions, node_shifts
 
     finally:
@@ -326,6 +438,234 @@ def measure_annotation_bounding_boxes(
             pass
 
 
+def run_measurement_passes(
+    temp_dir: str, format_dir: str = None, format_name: str = None
+) -> Tuple[int, str]:
+    """Run XeLaTeX on measurement.tex in temp_dir.
+
+    XeLaTeX runs directly without producing a PDF. The node positions of
+    remember-picture nodes are only known from the .aux file of a previous
+    run, so exactly two passes are needed (no bibliography or index). The
+    measurements are \\typeout lines, so they are read from the terminal
+    output of the last pass rather than from the .log file.
+
+    Returns:
+        Tuple of (first non-zero return code or 0, terminal output of the last pass)
+    """
+    command = ["xelatex", "-interaction=nonstopmode", "-no-pdf", "measurement.tex"]
+    env = None
+    if format_name is not None:
+        command.insert(1, f"-fmt={format_name}")
+        # XeLaTeX runs in temp_dir, so the format directory must be absolute;
+        # a trailing separator keeps the default format search path
+        env = dict(os.environ, TEXFORMATS=os.path.abspath(format_dir) + os.pathsep)
+
+    # Start from a clean .aux, a failed earlier attempt may have left a broken one
+    try:
+        os.remove(os.path.join(temp_dir, "measurement.aux"))
+    except OSError:
+        pass
+
+    for measurement_pass in range(1, MEASUREMENT_PASSES + 1):
+        last_pass = measurement_pass == MEASUREMENT_PASSES
+        result = subprocess.run(
+            command,
+            stdout=subprocess.PIPE if last_pass else subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            cwd=temp_dir,
+            env=env,
+        )
+        if result.returncode != 0:
+            return result.returncode, ""
+    return 0, result.stdout.decode("utf-8", errors="ignore")
+
+
+def measurement_format(cache_dir: str = None):
+    """Return the name of the precompiled measurement format in cache_dir, or None.
+
+    The format holds the measurement preamble up to \\endofdump, so runs
+    started from it skip loading beamer, TikZ and the other packages. It is
+    built once with mylatexformat and reused across runs; without a cache
+    directory or if building fails, measurements load the full preamble.
+    """
+    if not cache_dir:
+        return None
+    format_name = f"measurement-{fast_hash(_MEASUREMENT_PACKAGES)}"
+
+    with _measurement_format_lock:
+        if cache_dir not in _measurement_formats:
+            if not os.path.exists(os.path.join(cache_dir, f"{format_name}.fmt")):
+                if not build_measurement_format(cache_dir, format_name):
+                    format_name = None
+            _measurement_formats[cache_dir] = format_name
+        return _measurement_formats[cache_dir]
+
+
+def build_measurement_format(cache_dir: str, format_name: str) -> bool:
+    """Dump the measurement packages into cache_dir/<format_name>.fmt."""
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_dir = tempfile.mkdtemp(dir=cache_dir)
+    except OSError:
+        return False
+
+    try:
+        with open(os.path.join(temp_dir, "preamble.tex"), "w", encoding="utf-8") as f:
+            f.write(_MEASUREMENT_PACKAGES + "\\begin{document}\n\\end{document}\n")
+        result = subprocess.run(
+            [
+                "xelatex",
+                "-ini",
+                "-interaction=nonstopmode",
+                f"-jobname={format_name}",
+                "&xelatex",
+                "mylatexformat.ltx",
+                "preamble.tex",
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            cwd=temp_dir,
+        )
+        format_path = os.path.join(temp_dir, f"{format_name}.fmt")
+        if result.returncode != 0 or not os.path.exists(format_path):
+            return False
+        # Move into place atomically, other processes may be reading it
+        os.replace(format_path, os.path.join(cache_dir, f"{format_name}.fmt"))
+        return True
+    except OSError:
+        return False
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def discard_measurement_format(cache_dir: str, format_name: str) -> None:
+    """Stop using a measurement format that failed to load."""
+    with _measurement_format_lock:
+        _measurement_formats[cache_dir] = None
+    try:
+        os.remove(os.path.join(cache_dir, f"{format_name}.fmt"))
+    except OSError:
+        pass
+
+
+def measurement_cache_key(
+    equation_with_nodes: str,
+    annotation_specs: List[Tuple[str, str]],
+    has_columns: bool = False,
+) -> str:
+    """Cache key for a measurement; node names do not affect the layout."""
+    return fast_hash(
+        json.dumps(
+            [
+                _NODE_NAME_RE.sub("]{node}", equation_with_nodes),
+                annotation_specs,
+                has_columns,
+            ]
+        )
+    )
+
+
+def measure_equations_batch(
+    equation_blocks: List[Tuple[Block, bool]],
+    output_dir: str = ".",
+    cache_dir: str = None,
+    max_workers: int = None,
+) -> None:
+    """Measure several annotated equations concurrently to warm the measurement cache.
+
+    Each measurement runs LaTeX in its own temporary directory, so the runs are
+    independent and dispatched to a thread pool (the work happens in child
+    processes). Failures are ignored here; they resurface when the equation
+    is formatted.
+
+    Args:
+        equation_blocks: List of (block, has_columns) tuples
+        output_dir: Directory for temporary LaTeX runs
+        cache_dir: Optional directory to persist measurements in
+        max_workers: Number of concurrent LaTeX runs (None uses all CPUs)
+    """
+    pending = {}
+    for block, has_columns in equation_blocks:
+        equation_content, annotation_specs = parse_annotated_equation(block)
+        if not annotation_specs:
+            continue
+        try:
+            equation_with_nodes, node_names, _ = create_tikzmarknode_equation_new(
+                equation_content, annotation_specs, 0
+            )
+        except ValueError:
+            continue
+        cache_key = measurement_cache_key(
+            equation_with_nodes, annotation_specs, has_columns
+        )
+        if cache_key in _measurement_cache:
+            continue
+        if cache_dir and load_cached_measurements(
+            os.path.join(cache_dir, f"measurement-{cache_key}.json")
+        ) is not None:
+            continue
+        pending[cache_key] = (
+            equation_with_nodes,
+            annotation_specs,
+            node_names,
+            len(node_names),
+            output_dir,
+            has_columns,
+            cache_dir,
+        )
+
+    if not pending:
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        futures = [
+            executor.submit(measure_annotation_bounding_boxes, *args)
+            for args in pending.values()
+        ]
+        for future in futures:
+            try:
+                future.result()
+            except Exception:
+                pass
+
+
+def load_cached_measurements(cache_path: str):
+    """Load cached measurements, returning None if missing or unreadable."""
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+        bounding_boxes = {
+            int(k): (float(v[0]), float(v[1]))
+            for k, v in entry["bounding_boxes"].items()
+        }
+        node_positions = {int(k): float(v) for k, v in entry["node_positions"].items()}
+        node_shifts = {int(k): float(v) for k, v in entry["node_shifts"].items()}
+    except (OSError, json.JSONDecodeError, KeyError, TypeError, ValueError, IndexError):
+        return None
+    return bounding_boxes, node_positions, node_shifts
+
+
+def save_cached_measurements(
+    cache_path: str,
+    bounding_boxes: Dict[int, Tuple[float, float]],
+    node_positions: Dict[int, float],
+    node_shifts: Dict[int, float],
+) -> None:
+    """Save measurements to the cache (best effort)."""
+    entry = {
+        "bounding_boxes": bounding_boxes,
+        "node_positions": node_positions,
+        "node_shifts": node_shifts,
+    }
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+    except OSError:
+        # Ignore write errors - caching is best effort
+        pass
+
+
 def create_measurement_document(
     equation_with_nodes: str,
     annotation_specs: List[Tuple[str, str]],
@@ -334,11 +674,8 @@ def create_measurement_document(
     has_columns: bool = False,
 ) -> Tuple[str, int]:
     """Create LaTeX document for measuring annotation bounding boxes."""
-    # Use exactly the same preamble as the main document
-    preamble = r"""\documentclass[aspectratio=169,t]{beamer}
-% Theme and font setup
-\usetheme{default}
-\usepackage{graphicx}
+    # Use the same preamble as the main document, with the packages first
+    preamble = _MEASUREMENT_PACKAGES + r"""% Font setup
 \usepackage{fontspec}
 \usefonttheme{professionalfonts} % using non standard fonts for beamer
 \usefonttheme{serif} % default family is serif
@@ -348,12 +685,10 @@ def create_measurement_document(
   ItalicFont = *-Light Italic,
   BoldItalicFont = * Italic
 ]
-\usepackage{xcolor}
 \definecolor{navyblue}{RGB}{10,45,100}
 \definecolor{ncblue}{RGB}{221,150,51}
 \definecolor{ncblue}{RGB}{10,45,100}
 
-\usepackage[para]{footmisc}
 \setbeamercolor{section title}{fg=navyblue}
 \setbeamerfont{section title}{series=\bfseries}
 
@@ -377,18 +712,12 @@ def create_measurement_document(
   }%
   \tikzset{tikzmark prefix=frame\insertframenumber}
 }
-\usepackage{amsmath}
 \renewcommand{\theequation}{\textcolor{ncblue}{\arabic{equation}}}
 \makeatletter
 \renewcommand{\tagform@}[1]{\maketag@@@{\textcolor{ncblue}{(#1)}}}
 \makeatother
-\usepackage{tikz}
-\usetikzlibrary{tikzmark,calc,positioning}
 \pgfdeclarelayer{background}
 \pgfsetlayers{background,main}
-\usepackage{colortbl}
-\usepackage{array}
-\usepackage{booktabs}
 \setlength{\parskip}{1.5em}
 \setlength{\parindent}{0pt}
 \setlength{\abovedisplayskip}{0pt}
@@ -444,18 +773,15 @@ def create_measurement_document(
 """
 
     # Create measurement commands for each annotation text
-    measurement_commands = [equation_command]
-    for i, (exact_string, label) in enumerate(annotation_specs, 1):
-        # Use letters instead of numbers for savebox names (A, B, C, etc.)
-        letter = chr(ord("A") + i - 1)  # A=1, B=2, C=3, etc.
-        measurement_commands.append(
-            f"""
-% Measure annotation {i}: {label}
-\\newsavebox{{\\measurebox{letter}}}
-\\sbox{{\\measurebox{letter}}}{{\\scriptsize {label}}}
-\\typeout{{ANNOTATION{i}: width=\\the\\wd\\measurebox{letter}, height=\\the\\ht\\measurebox{letter}}}
-"""
-        )
+    measurement_commands = [
+        equation_command,
+        *(
+            _MEASURE_ANNOTATION_TEMPLATE.format(
+                i=i, letter=_SAVEBOX_LETTERS[i - 1], label=label
+            )
+            for i, (exact_string, label) in enumerate(annotation_specs, 1)
+        ),
+    ]
 
     # Add position measurements for each node using tikz coordinate extraction
     # These need to be after the equation is rendered so the nodes exist
@@ -510,7 +836,15 @@ def create_measurement_document(
 def parse_measurements_from_log(
     log_path: str, num_annotations: int
 ) -> Tuple[Dict[int, Tuple[float, float]], Dict[int, float], Dict[int, float]]:
-    """Parse bounding box measurements and node positions from LaTeX log file.
+    """Parse bounding box measurements and node positions from LaTeX log file."""
+    with open(log_path, "r", encoding="utf-8", errors="ignore") as f:
+        return parse_measurements(f, num_annotations)
+
+
+def parse_measurements(
+    lines: Iterable[str], num_annotations: int
+) -> Tuple[Dict[int, Tuple[float, float]], Dict[int, float], Dict[int, float]]:
+    """Parse bounding box measurements and node positions from LaTeX output lines.
 
     Returns:
         Tuple of (bounding_boxes, node_positions, node_shifts) where:
@@ -522,28 +856,48 @@ def parse_measurements_from_log(
     node_positions = {}
     node_shifts = {}
 
-    with open(log_path, "r", encoding="utf-8", errors="ignore") as f:
-        log_content = f.read()
-
-    # Parse baseline position first
+    # Read line by line and stop once all measurements are found
+    # (first match wins)
     baseline_y = None
-    baseline_pattern = "BASELINEPOS: x=([0-9.-]+)pt, y=([0-9.-]+)pt"
-    baseline_match = re.search(baseline_pattern, log_content)
-    if baseline_match:
-        baseline_y = float(baseline_match.group(2))
-    else:
+    measured_boxes = {}
+    measured_nodes = {}
+    wanted = set(range(1, num_annotations + 1))
+    for line in lines:
+        if "ANNOTATION" in line:
+            match = _ANNOTATION_MEASURE_RE.search(line)
+            if match:
+                # Keep values in pt - no conversion needed
+                measured_boxes.setdefault(
+                    int(match.group(1)),
+                    (float(match.group(2)), float(match.group(3))),
+                )
+        elif "NODEPOS" in line:
+            match = _NODEPOS_RE.search(line)
+            if match:
+                measured_nodes.setdefault(
+                    int(match.group(1)),
+                    (float(match.group(2)), float(match.group(3))),
+                )
+        elif baseline_y is None and "BASELINEPOS" in line:
+            match = _BASELINE_RE.search(line)
+            if match:
+                baseline_y = float(match.group(2))
+
+        if (
+            baseline_y is not None
+            and wanted <= measured_boxes.keys()
+            and wanted <= measured_nodes.keys()
+        ):
+            break
+
+    if baseline_y is None:
         print("Warning: Could not find baseline position", file=sys.stderr)
         baseline_y = 0.0  # Fallback to 0 if baseline not found
 
     # Parse bounding box measurements from typeout commands
     for i in range(1, num_annotations + 1):
-        pattern = f"ANNOTATION{i}: width=([0-9.]+)pt, height=([0-9.]+)pt"
-        match = re.search(pattern, log_content)
-        if match:
-            width_pt = float(match.group(1))
-            height_pt = float(match.group(2))
-            # Keep values in pt - no conversion needed
-            bounding_boxes[i] = (width_pt, height_pt)
+        if i in measured_boxes:
+            bounding_boxes[i] = measured_boxes[i]
         else:
             # Fallback if measurement not found
             print(
@@ -554,12 +908,8 @@ def parse_measurements_from_log(
 
     # Parse node position measurements and calculate shifts from baseline
     for i in range(1, num_annotations + 1):
-        # Look for the format: NODEPOS1: x=123.456pt, y=789.012pt (no space before pt)
-        pattern = f"NODEPOS{i}: x=([0-9.-]+)pt, y=([0-9.-]+)pt"
-        match = re.search(pattern, log_content)
-        if match:
-            x_pt = float(match.group(1))
-            y_pt = float(match.group(2))
+        if i in measured_nodes:
+            x_pt, y_pt = measured_nodes[i]
             # Keep x position in pt - no conversion needed
             node_positions[i] = x_pt
             # Calculate shift from baseline (positive means above baseline)
@@ -578,12 +928,15 @@ def find_optimal_placement(
     node_shifts: Dict[int, float],
     has_columns: bool = False,
 ) -> Tuple[Dict[int, Tuple[float, str]], Dict[int, Tuple[float, str]]]:
-    """Find optimal placement using brute force search with minimal vertical levels."""
-    from itertools import product
+    """Find optimal placement using depth-first search with minimal vertical levels.
 
+    Annotations are assigned one at a time and a partial placement is abandoned
+    as soon as it violates a constraint, so a valid placement with the fewest
+    levels is found without enumerating all combinations.
+    """
     num_annotations = len(annotation_specs)
 
-    # Simple brute force: try increasing number of levels until we find a solution
+    # Simple search: try increasing number of levels until we find a solution
     max_attempts = 5  # Safety limit
 
     for num_levels in range(1, max_attempts + 1):
@@ -593,33 +946,30 @@ def find_optimal_placement(
         levels_below = [base_level_pt + i * 15.0 for i in range(num_levels)]
         levels_above = [20.0]
 
-        # Try all combinations for this number of levels
-        all_combinations = generate_placement_combinations(
-            num_annotations, levels_above, levels_below
+        options = generate_placement_options(levels_above, levels_below)
+        combination = search_placement(
+            num_annotations,
+            options,
+            bounding_boxes,
+            node_positions,
+            page_width_pt,
+            horizontal_padding_pt,
+            node_shifts,
+            has_columns,
         )
-        for combination in all_combinations:
-            if check_placement_validity(
-                combination,
-                bounding_boxes,
-                node_positions,
-                page_width_pt,
-                horizontal_padding_pt,
-                node_shifts,
-                has_columns,
-            ):
-                # Found valid placement with num_levels levels
-                above_placements = {}
-                below_placements = {}
+        if combination is not None:
+            # Found valid placement with num_levels levels
+            above_placements = {}
+            below_placements = {}
 
-                # print(f"Debug: Found valid placement with {num_levels} levels: {combination}", file=sys.stderr)
-                for i, (position, level, anchor) in enumerate(combination, 1):
-                    if i in node_names:
-                        if position == "above":
-                            above_placements[i] = (level, anchor)
-                        else:  # position == "below"
-                            below_placements[i] = (level, anchor)
+            for i, (position, level, anchor) in enumerate(combination, 1):
+                if i in node_names:
+                    if position == "above":
+                        above_placements[i] = (level, anchor)
+                    else:  # position == "below"
+                        below_placements[i] = (level, anchor)
 
-                return above_placements, below_placements
+            return above_placements, below_placements
 
     # If we get here, no solution found within reasonable bounds
     print(
@@ -633,142 +983,184 @@ def find_optimal_placement(
     return {}, below_placements
 
 
-def generate_placement_combinations(
-    num_annotations: int, levels_above: List[float], levels_below: List[float]
-) -> List[List[Tuple[str, float, str]]]:
-    """Generate all possible placement combinations - simple brute force."""
-    from itertools import product
+def generate_placement_options(
+    levels_above: List[float], levels_below: List[float]
+) -> List[Tuple[str, float, str]]:
+    """Generate all possible (position, level, anchor) options for one annotation."""
+    options = []
 
-    # For each annotation, generate all possible (position, level, anchor) options
-    options_per_annotation = []
+    # Below positions (only using below for simplicity)
+    for level in levels_below:
+        options.append(("below", level, "base west"))  # extends right
+        options.append(("below", level, "base east"))  # extends left
 
-    for i in range(num_annotations):
-        annotation_options = []
+    # Above positions (if any levels defined above)
+    for level in levels_above:
+        options.append(("above", level, "base west"))  # extends right
+        options.append(("above", level, "base east"))  # extends left
 
-        # Below positions (only using below for simplicity)
-        for level in levels_below:
-            annotation_options.append(
-                ("below", level, "base west")
-            )  # extends right
-            annotation_options.append(("below", level, "base east"))  # extends left
+    return options
 
-        # Above positions (if any levels defined above)
-        for level in levels_above:
-            annotation_options.append(
-                ("above", level, "base west")
-            )  # extends right
-            annotation_options.append(("above", level, "base east"))  # extends left
 
-        options_per_annotation.append(annotation_options)
-
-    # Generate all combinations - no sorting, just return them in iterator order
-    combinations = list(product(*options_per_annotation))
-    return combinations
-
-
-def check_placement_validity(
-    combination: List[Tuple[str, float, str]],
+def search_placement(
+    num_annotations: int,
+    options: List[Tuple[str, float, str]],
     bounding_boxes: Dict[int, Tuple[float, float]],
     node_positions: Dict[int, float],
     page_width_pt: float,
     horizontal_padding_pt: float,
     node_shifts: Dict[int, float],
     has_columns: bool = False,
-) -> bool:
-    """Check if a placement combination is valid (no overlaps, fits in page width)."""
-    # Group annotations by position and level for collision detection
-    placements_by_level = {}
-
-    for i, (position, level, anchor) in enumerate(combination, 1):
-        if node_shifts[i] < 0 and position == "above":
-            # Node is below baseline, cannot place annotation above
-            return False
-        if node_shifts[i] > 0 and position == "below":
-            # Node is above baseline, cannot place annotation below
-            return False
+):
+    """Depth-first search for a valid placement (no overlaps, fits in page width).
+
+    The widest annotations are placed first, as they are the hardest to fit.
+    Each annotation tries the lowest levels first, and on a given level the
+    anchor that keeps its text box closest to the page center.
+
+    Returns a list of (position, level, anchor) per annotation, or None.
+    """
+    # In two-column mode, use smaller left margin since we're within a column
+    left_margin = 5.0 if has_columns else 20.0
+    # Clearance between text boxes and vertical lines from other levels
+    clearance = 5.0
+
+    combination = [None] * (num_annotations + 1)
+    # Sorted levels in use per position, and the placed text boxes on each
+    # (position, level) as parallel [left_bounds, right_bounds, node_xs]
+    # lists, sorted by left bound so that overlaps only need checking
+    # against the neighbours
+    levels_by_position = {"above": [], "below": []}
+    boxes_by_level = {}
+
+    # Annotation geometry as parallel lists indexed by annotation number,
+    # with text box bounds per anchor; node_xs[i] is None without geometry
+    node_xs = [None] * (num_annotations + 1)
+    lefts = {"base west": [0.0] * (num_annotations + 1), "base east": [0.0] * (num_annotations + 1)}
+    rights = {"base west": [0.0] * (num_annotations + 1), "base east": [0.0] * (num_annotations + 1)}
+    for i in range(1, num_annotations + 1):
         if i not in bounding_boxes or i not in node_positions:
             continue
-
-        width_pt, height_pt = bounding_boxes[i]
         node_x = node_positions[i]
-        padded_width = width_pt + 1 * horizontal_padding_pt
-
-        # Calculate annotation bounds based on anchor
-        if anchor == "base west":  # Left-aligned text extends right from node
-            left_bound = node_x
-            right_bound = node_x + padded_width
-        else:  # "base east" - Right-aligned text extends left from node
-            left_bound = node_x - padded_width
-            right_bound = node_x
-
-        key = (position, level)
-        if key not in placements_by_level:
-            placements_by_level[key] = []
-
-        placements_by_level[key].append(
-            (i, left_bound, right_bound, anchor, padded_width)
-        )
-
-    # print(placements_by_level, file=sys.stderr)
-
-    # Check each level for overlaps and page width constraints
-    for (position, level), annotations in placements_by_level.items():
-        # Sort annotations by left bound for overlap detection
-        annotations.sort(key=lambda x: x[1])  # Sort by left_bound
-
-        # Check for overlaps between adjacent annotations
-        for j in range(len(annotations) - 1):
-            curr = annotations[j]
-            next_ann = annotations[j + 1]
-
-            curr_right = curr[2]  # right_bound
-            next_left = next_ann[1]  # left_bound
-
-            if curr_right > next_left:
-                # print(
-                #     f"Debug: Overlap detected - annotation {curr[0]} ends at {curr_right:.2f}pt, annotation {next_ann[0]} starts at {next_left:.2f}pt",
-                #     file=sys.stderr,
-                # )
-                return False
-
-        # Check if any annotation extends beyond page boundaries
-        # In two-column mode, use smaller left margin since we're within a column
-        left_margin = 5.0 if has_columns else 20.0
-        for i, left_bound, right_bound, _, _ in annotations:
-            if left_bound < left_margin or right_bound > page_width_pt:
-                return False
-
-    # Check for vertical line crossings: text boxes crossing through vertical lines from other levels
-    for (position_1, level_1), annotations_1 in placements_by_level.items():
-        for (position_2, level_2), annotations_2 in placements_by_level.items():
-            # only check same position
-            if position_1 != position_2:
-                continue
+        padded_width = bounding_boxes[i][0] + 1 * horizontal_padding_pt
+        node_xs[i] = node_x
+        # Left-aligned text extends right from node
+        lefts["base west"][i] = node_x
+        rights["base west"][i] = node_x + padded_width
+        # Right-aligned text extends left from node
+        lefts["base east"][i] = node_x - padded_width
+        rights["base east"][i] = node_x
+
+    # Rank of each (position, level) in the preferred order of options
+    level_ranks = {}
+    for position, level, anchor in options:
+        level_ranks.setdefault((position, level), len(level_ranks))
+    page_center = page_width_pt / 2
+
+    def preference(i, option):
+        position, level, anchor = option
+        if node_xs[i] is None:
+            return level_ranks[(position, level)], 0.0
+        box_center = (lefts[anchor][i] + rights[anchor][i]) / 2
+        return level_ranks[(position, level)], abs(box_center - page_center)
+
+    # Drop the options that fail regardless of the other annotations
+    candidates = {}
+    for i in range(1, num_annotations + 1):
+        shift = node_shifts[i]
+        candidates[i] = [
+            (position, level, anchor)
+            for position, level, anchor in options
+            # Node below baseline cannot be annotated above, and vice versa
+            if not (shift < 0 and position == "above")
+            and not (shift > 0 and position == "below")
+            # Annotation must not extend beyond page boundaries
+            and (node_xs[i] is None or (lefts[anchor][i] >= left_margin and rights[anchor][i] <= page_width_pt))
+        ]
+        if not candidates[i]:
+            return None
+        candidates[i].sort(key=lambda option: preference(i, option))
+
+    # Widest annotations first; those without geometry constrain nothing
+    order = sorted(
+        range(1, num_annotations + 1),
+        key=lambda i: -(rights["base west"][i] - lefts["base west"][i]) if node_xs[i] is not None else 0.0,
+    )
 
-            # only check different levels
-            if level_1 >= level_2:
+    def fits(i, position, level, anchor):
+        """Check annotation i against the already placed ones."""
+        node_x = node_xs[i]
+        if node_x is None:
+            return True, None
+
+        left_bound = lefts[anchor][i]
+        right_bound = rights[anchor][i]
+
+        # Check for overlap with the neighbouring annotations on the same level
+        boxes = boxes_by_level.get((position, level))
+        if boxes:
+            box_lefts, box_rights, _ = boxes
+            k = bisect_right(box_lefts, left_bound)
+            if k > 0 and box_rights[k - 1] > left_bound:
+                return False, None
+            if k < len(box_lefts) and right_bound > box_lefts[k]:
+                return False, None
+
+        # Check for vertical line crossings with the other levels of this position
+        levels = levels_by_position[position]
+        for other_level in levels[: bisect_left(levels, level)]:
+            # Text boxes on lower levels must not cross this vertical line
+            box_lefts, box_rights, _ = boxes_by_level[(position, other_level)]
+            for other_left, other_right in zip(box_lefts, box_rights):
+                if other_left < node_x + clearance and other_right > node_x - clearance:
+                    return False, None
+        for other_level in levels[bisect_right(levels, level) :]:
+            # This text box must not cross vertical lines from higher levels
+            for other_x in boxes_by_level[(position, other_level)][2]:
+                if left_bound < other_x + clearance and right_bound > other_x - clearance:
+                    return False, None
+
+        return True, (position, level, left_bound, right_bound, node_x)
+
+    def place(box):
+        position, level, left_bound, right_bound, node_x = box
+        boxes = boxes_by_level.setdefault((position, level), [[], [], []])
+        box_lefts, box_rights, box_xs = boxes
+        if not box_lefts:
+            insort(levels_by_position[position], level)
+        k = bisect_right(box_lefts, left_bound)
+        box_lefts.insert(k, left_bound)
+        box_rights.insert(k, right_bound)
+        box_xs.insert(k, node_x)
+
+    def unplace(box):
+        position, level, left_bound = box[0], box[1], box[2]
+        box_lefts, box_rights, box_xs = boxes_by_level[(position, level)]
+        k = bisect_left(box_lefts, left_bound)
+        del box_lefts[k], box_rights[k], box_xs[k]
+        if not box_lefts:
+            levels_by_position[position].remove(level)
+
+    def assign(depth):
+        if depth == num_annotations:
+            return True
+        i = order[depth]
+        for position, level, anchor in candidates[i]:
+            valid, box = fits(i, position, level, anchor)
+            if not valid:
                 continue
+            combination[i] = (position, level, anchor)
+            if box is not None:
+                place(box)
+            if assign(depth + 1):
+                return True
+            if box is not None:
+                unplace(box)
+        return False
 
-            # Check if any text box from level_1 crosses through vertical lines from level_2
-            for ann_1 in annotations_1:
-                _, ann_1_left, ann_1_right, _, _ = ann_1
-
-                for ann_2 in annotations_2:
-                    ann_2_id, _, _, _, _ = ann_2
-
-                    # Get the vertical line position for annotation 2 (its node position)
-                    if ann_2_id in node_positions:
-                        vertical_line_x = node_positions[ann_2_id]
-
-                        # Check if annotation 1's text box crosses through annotation 2's vertical line
-                        # Use 10pt clearance as specified
-                        clearance = 5.0
-                        if (
-                            ann_1_left < vertical_line_x + clearance
-                            and ann_1_right > vertical_line_x - clearance
-                        ):
-                            return False
-    return True
+    if assign(0):
+        return combination[1:]
+    return None
 
 
 def generate_tikzpicture_annotations(
@@ -777,67 +1169,48 @@ def generate_tikzpicture_annotations(
     node_names: Dict[int, str],
     above_placements: Dict[int, Tuple[float, str]] = None,
     below_placements: Dict[int, Tuple[float, str]] = None,
-) -> Tuple[List[str], Dict[str, int]]:
+) -> Tuple[str, Dict[str, int]]:
     """Generate tikzpicture code for annotations and return space requirements."""
-    tikz_parts = []
-    tikz_parts.append("\\begin{tikzpicture}[remember picture, overlay]")
+    tikz_code = io.StringIO()
+    tikz_code.write("\\begin{tikzpicture}[remember picture, overlay]")
 
     # Calculate heights with left/right alignment optimization
     above_heights = {}
     below_heights = {}
     above_anchors = {}  # Track which side each annotation goes on
     below_anchors = {}
+    # Space requirements in pt (heights are positive), tracked while assigning
+    max_above_height = 0
+    max_below_height = 0
 
     # Use placement information if provided, otherwise fall back to old logic
     if above_placements is not None:
         # Use new placement logic for above annotations
-        for pos in annotations_above.keys():
+        for pos in annotations_above:
             if pos in above_placements:
                 height, anchor = above_placements[pos]
                 above_heights[pos] = height
                 above_anchors[pos] = anchor
+                if height > max_above_height:
+                    max_above_height = height
     else:
         # Fall back to old placement logic for above annotations
-        sorted_above = sorted(annotations_above.keys())
-        for i, pos in enumerate(sorted_above):
-            if i < len(sorted_above) / 2:
-                # Left side: positions 1, 2 (ascending heights)
-                above_heights[pos] = 2 + i  # 2em, 3em
-                above_anchors[pos] = (
-                    "base east"  # Right-aligned text (anchored to east)
-                )
-            else:
-                # Right side: positions 3, 4 - reverse order for pyramid shape
-                right_index = len(sorted_above) - 1 - i  # Reverse mapping
-                above_heights[pos] = 2 + right_index  # 3em, 2em (descending)
-                above_anchors[pos] = (
-                    "base west"  # Left-aligned text (anchored to west)
-                )
+        above_heights, above_anchors = _pyramid_placements(annotations_above)
+        max_above_height = max(above_heights.values(), default=0)
 
     if below_placements is not None:
         # Use new placement logic for below annotations
-        for pos in annotations_below.keys():
+        for pos in annotations_below:
             if pos in below_placements:
                 height, anchor = below_placements[pos]
                 below_heights[pos] = height
                 below_anchors[pos] = anchor
+                if height > max_below_height:
+                    max_below_height = height
     else:
         # Fall back to old placement logic for below annotations
-        sorted_below = sorted(annotations_below.keys())
-        for i, pos in enumerate(sorted_below):
-            if i < len(sorted_below) / 2:
-                # Left side (ascending heights)
-                below_heights[pos] = 2 + i  # 2em, 3em
-                below_anchors[pos] = "base east"  # Right-aligned text
-            else:
-                # Right side - reverse order for pyramid shape
-                right_index = len(sorted_below) - 1 - i  # Reverse mapping
-                below_heights[pos] = 2 + right_index  # 3em, 2em (descending)
-                below_anchors[pos] = "base west"  # Left-aligned text
-
-    # Calculate space requirements in pt
-    max_above_height = max(above_heights.values()) if above_heights else 0
-    max_below_height = max(below_heights.values()) if below_heights else 0
+        below_heights, below_anchors = _pyramid_placements(annotations_below)
+        max_below_height = max(below_heights.values(), default=0)
 
     # Add buffer for below annotations since they extend down from equation baseline
     # The annotation extends down by the height value, plus some padding (in pt)
@@ -845,64 +1218,70 @@ def generate_tikzpicture_annotations(
 
     space_requirements = {"above": max_above_height, "below": adjusted_below_height}
 
-    # Generate above annotations
-    for pos, text in annotations_above.items():
-        if pos not in node_names:
-            continue
-        node_name = node_names[pos]
-        height = above_heights[pos]
-        anchor = above_anchors[pos]
-
-        # Determine xshift based on anchor - shift outwards more for space saving
-        xshift = "-0.2em" if anchor == "base east" else "0.2em"
-
-        # Convert height from pt to LaTeX output (still using pt)
-        reduced_height = height - 5.0  # Reduce by 5pt instead of 0.5em
-        yshift = "3pt"  # Shift down slightly like bottom annotations
-
-        tikz_parts.append(f"    %above annotation {pos}")
-        tikz_parts.append(
-            f"\path[fill=ncblue!15,draw=none,line width=0pt] ({node_name}.north west) -- ({node_name}.north east) -- ([yshift=13pt]{node_name}.base east) -- ([yshift=13pt]{node_name}.base west) -- cycle;"
-        )
-
-        tikz_parts.append(
-            f"    \\draw[ncblue, line width=0.4mm] ([yshift=13pt]{node_name}.base west) -- ([yshift=13pt]{node_name}.base east);"
-        )
-        tikz_parts.append(
-            f"    \\draw[ncblue,] ([yshift=13pt]{node_name}.base) -- ([yshift={height}pt]{node_name}.base);"
-        )
-        tikz_parts.append(
-            f"    \\node[above={reduced_height}pt of {node_name}.base,anchor={anchor},inner sep=0,outer sep=0,xshift={xshift},yshift={yshift},text=ncblue] {{\\scriptsize {text}}};"
-        )
-        tikz_parts.append("")
+    # Generate above annotations, then below annotations
+    _emit_annotations(
+        tikz_code, _ABOVE_ANNOTATION_TEMPLATE, annotations_above, node_names,
+        above_heights, above_anchors, "0.2em",
+    )
+    _emit_annotations(
+        tikz_code, _BELOW_ANNOTATION_TEMPLATE, annotations_below, node_names,
+        below_heights, below_anchors, "2pt",
+    )
 
-    # Generate below annotations
-    for pos, text in annotations_below.items():
-        if pos not in node_names:
-            continue
-        node_name = node_names[pos]
-        height = below_heights[pos]
-        anchor = below_anchors[pos]
+    tikz_code.write("\n\\end{tikzpicture}")
+    return tikz_code.getvalue(), space_requirements
 
-        # Determine xshift based on anchor
-        xshift = "-2pt" if anchor == "base east" else "2pt"
 
-        tikz_parts.append(f"    %below annotation {pos}")
-        tikz_parts.append(
-            f"\path[fill=ncblue!15,draw=none,line width=0pt] ({node_name}.south west) -- ({node_name}.south east) -- ([yshift=-8pt]{node_name}.base east) -- ([yshift=-8pt]{node_name}.base west) -- cycle;"
-        )
+def _pyramid_placements(
+    annotations: Dict[int, str]
+) -> Tuple[Dict[int, int], Dict[int, str]]:
+    """Fallback placement: heights rise towards the middle annotations.
 
-        # Draw the annotation line and connecting line
-        tikz_parts.append(
-            f"    \\draw[ncblue, line width=0.4mm] ([yshift=-8pt]{node_name}.base west) -- ([yshift=-8pt]{node_name}.base east);"
-        )
-        tikz_parts.append(
-            f"    \\draw[ncblue,] ([yshift=-8pt]{node_name}.base) -- ([yshift=-{height}pt]{node_name}.base);"
-        )
-        tikz_parts.append(
-            f"    \\node[below={height}pt of {node_name}.base,anchor={anchor},inner sep=0,outer sep=0,xshift={xshift},yshift=-3pt,text=ncblue] {{\\scriptsize {text}}};"
-        )
-        tikz_parts.append("")
+    The left half (positions 1, 2, ...) is right-aligned with ascending
+    heights 2em, 3em, ...; the right half is left-aligned in reverse order
+    for a pyramid shape.
+    """
+    positions = sorted(annotations)
+    last = len(positions) - 1
+    half = len(positions) / 2
+    heights = {
+        pos: 2 + (i if i < half else last - i) for i, pos in enumerate(positions)
+    }
+    anchors = {
+        pos: "base east" if i < half else "base west" for i, pos in enumerate(positions)
+    }
+    return heights, anchors
+
+
+def _emit_annotations(
+    tikz_code: io.StringIO,
+    template: str,
+    annotations: Dict[int, str],
+    node_names: Dict[int, str],
+    heights: Dict[int, float],
+    anchors: Dict[int, str],
+    xshift: str,
+) -> None:
+    """Write the TikZ code for the annotations on one side of the equation.
 
-    tikz_parts.append("\\end{tikzpicture}")
-    return tikz_parts, space_requirements
\ No newline at end of file
+    The text is shifted outwards by xshift, away from its connecting line.
+    """
+    # Annotations without a node are skipped; usually all of them have one
+    if not annotations.keys() <= node_names.keys():
+        annotations = {pos: text for pos, text in annotations.items() if pos in node_names}
+
+    write = tikz_code.write
+    params = {}
+    for pos, text in annotations.items():
+        anchor = anchors[pos]
+        height = heights[pos]
+        params["pos"] = pos
+        params["node_name"] = node_names[pos]
+        params["height"] = height
+        # Text above starts 5pt below its line end (instead of 0.5em)
+        params["reduced_height"] = height - 5.0
+        params["anchor"] = anchor
+        params["xshift"] = f"-{xshift}" if anchor == "base east" else xshift
+        params["text"] = text
+        write("\n")
+        write(template.format_map(params))
@@ -1,7 +1,19 @@
 import os
-import tempfile
+import io
+import shutil
+import string
+import traceback
 import subprocess
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator, List, Tuple
 from .models import BlockType
+from .hashing import fast_hash
+
+# Working directory of the current figure worker process
+_worker_cwd = None
 
 
 def generate_figure_file(
@@ -11,37 +23,218 @@ def generate_figure_file(
     has_columns: bool = False,
     output_dir: str = ".",
 ):
-    """Generate a single figure file with the specified parameters."""
-    # Create Python script for subplot execution (filename relative to output_dir)
-    python_script = create_matplotlib_script(code, block_type, filename, has_columns)
+    """Generate a single figure file with the specified parameters.
+
+    Generation is skipped if the figure already exists and was produced by an
+    identical script, as recorded in a ``.sha`` file next to the figure.
+    """
+    for _ in generate_figures_batch([(code, block_type, filename, has_columns, output_dir)]):
+        pass
+
+
+def generate_figures_batch(
+    jobs: List[Tuple[str, BlockType, str, bool, str]], cache_dir: str = None
+) -> Iterator[str]:
+    """Generate several figures in parallel, one worker process per CPU.
+
+    The worker pool is only started if a figure has to be rendered, with
+    at most one worker per figure, and shut down once all are done.
+
+    If cache_dir is given, rendered figures are stored there keyed by their
+    script (without the output filename), and copied from there when the
+    same figure shows up again, e.g. under another input file name.
+
+    Args:
+        jobs: List of (code, block_type, filename, has_columns, output_dir)
+            tuples, as taken by generate_figure_file
+        cache_dir: Optional directory to keep rendered figures in
+
+    Yields:
+        The filename of each figure once it is done, in the order of jobs.
+        A failing figure raises RuntimeError when its turn comes.
+    """
+    # Create Python scripts; None marks figures whose script is unchanged
+    pending = []
+    for job in jobs:
+        code, block_type, filename, has_columns, output_dir = job
+        python_script = create_matplotlib_script(code, block_type, filename, has_columns)
+        hash_file = os.path.join(output_dir, filename) + ".sha"
+        script_hash = fast_hash(python_script)
+        figure_path = os.path.join(output_dir, filename)
+        cache_path = None
+        if cache_dir:
+            cache_key = fast_hash(
+                create_matplotlib_script(code, block_type, "figure.pdf", has_columns)
+            )
+            cache_path = os.path.join(cache_dir, f"figure-{cache_key}.pdf")
+        if _figure_is_current(figure_path, hash_file, script_hash):
+            python_script = None
+        elif cache_path and _copy_cached_figure(cache_path, figure_path):
+            with open(hash_file, "w", encoding="utf-8") as f:
+                f.write(script_hash)
+            python_script = None
+        pending.append((job, python_script, hash_file, script_hash, cache_path))
 
-    # Write script to temporary file
-    with tempfile.NamedTemporaryFile(mode="w", suffix=".py", delete=False) as temp_file:
-        temp_file.write(python_script)
-        temp_script_path = temp_file.name
+    # Run the scripts in the figure workers
+    script_count = sum(python_script is not None for _, python_script, _, _, _ in pending)
+    if not script_count:
+        for job, _, _, _, _ in pending:
+            yield job[2]
+        return
 
+    executor = _figure_pool(min(os.cpu_count() or 1, script_count))
     try:
-        # Execute Python script using subprocess
-        result = subprocess.run(
-            ["python", temp_script_path],
-            capture_output=True,
-            text=True,
-            cwd=output_dir,
-        )
-
-        if result.returncode != 0:
+        yield from _collect_figures(executor, pending)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _collect_figures(executor: ProcessPoolExecutor, pending: list) -> Iterator[str]:
+    """Submit the pending figure scripts and yield each filename once it is done."""
+    futures = []
+    for job, python_script, _, _, _ in pending:
+        if python_script is None:
+            futures.append(None)
+            continue
+        try:
+            future = executor.submit(
+                _run_figure_script, python_script, os.path.abspath(job[4])
+            )
+        except BrokenProcessPool:
+            future = None
+        futures.append(future)
+
+    for (job, python_script, hash_file, script_hash, cache_path), future in zip(pending, futures):
+        code, block_type, filename, has_columns, output_dir = job
+        if python_script is None:
+            yield filename
+            continue
+        try:
+            if future is None:
+                raise BrokenProcessPool()
+            success, error_output = future.result()
+        except BrokenProcessPool:
+            success = None
+        if success is None:
+            # Run in a fresh interpreter if the workers cannot be used
+            # (e.g. matplotlib is not importable here)
+            success, error_output = _run_figure_subprocess(python_script, output_dir)
+
+        if not success:
             raise RuntimeError(
                 f"Error generating figure {filename} ({block_type.value}):\n"
                 f"Code:\n{code}\n\n"
-                f"Error output:\n{result.stderr}"
+                f"Error output:\n{error_output}"
             )
 
+        # Record the script hash once the figure has been generated
+        with open(hash_file, "w", encoding="utf-8") as f:
+            f.write(script_hash)
+        if cache_path:
+            _store_cached_figure(os.path.join(output_dir, filename), cache_path)
+
+        yield filename
+
+
+def _figure_is_current(figure_path: str, hash_file: str, script_hash: str) -> bool:
+    """Check whether the figure was generated by a script with this hash."""
+    if not (os.path.exists(figure_path) and os.path.exists(hash_file)):
+        return False
+    with open(hash_file, "r", encoding="utf-8") as f:
+        return f.read().strip() == script_hash
+
+
+def _copy_cached_figure(cache_path: str, figure_path: str) -> bool:
+    """Copy a cached figure into place, returning False on a cache miss."""
+    try:
+        shutil.copyfile(cache_path, figure_path)
+    except OSError:
+        return False
+    return True
+
+
+def _store_cached_figure(figure_path: str, cache_path: str) -> None:
+    """Store a rendered figure in the cache (best effort)."""
+    temp_path = cache_path + ".tmp"
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        shutil.copyfile(figure_path, temp_path)
+        os.replace(temp_path, cache_path)
+    except OSError:
+        # Ignore write errors - caching is best effort
+        pass
+
+
+def _figure_pool(max_workers: int) -> ProcessPoolExecutor:
+    """Create a pool of figure workers.
+
+    Workers are never plain forks of this process, which may be running
+    other threads. Where available, a forkserver imports numpy and
+    matplotlib once, so each worker starts as a cheap fork with the
+    imports already done; otherwise workers are spawned.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["numpy", "matplotlib", "matplotlib.pyplot"])
+    else:
+        context = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=context, initializer=_preimport
+    )
+
+
+def _preimport():
+    """Import numpy and matplotlib once when a figure worker starts."""
+    try:
+        import numpy  # noqa: F401
+        import matplotlib
+
+        matplotlib.use("Agg")
+        import matplotlib.pyplot  # noqa: F401
+    except ImportError:
+        # Reported per figure by _run_figure_script
+        pass
+
+
+def _run_figure_script(python_script: str, output_dir: str) -> Tuple[bool, str]:
+    """Execute a figure script in the worker process.
+
+    The rcParams are restored and all figures closed afterwards, so one
+    figure's settings do not leak into the next. Returns (success, error output),
+    with success None if matplotlib is not available in the worker.
+    """
+    try:
+        import matplotlib
+        import matplotlib.pyplot as plt
+    except ImportError:
+        return None, ""
+
+    # Workers stay in the output directory between figures
+    global _worker_cwd
+    if output_dir != _worker_cwd:
+        os.chdir(output_dir)
+        _worker_cwd = output_dir
+    stderr = io.StringIO()
+    try:
+        with matplotlib.rc_context(), contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(stderr):
+            exec(compile(python_script, "<figure>", "exec"), {"__name__": "__main__"})
+    except (Exception, SystemExit):
+        return False, stderr.getvalue() + traceback.format_exc()
     finally:
-        # Clean up temporary script
-        try:
-            os.unlink(temp_script_path)
-        except OSError:
-            pass
+        plt.close("all")
+    return True, stderr.getvalue()
+
+
+def _run_figure_subprocess(python_script: str, output_dir: str) -> Tuple[bool, str]:
+    """Execute a figure script in a fresh Python interpreter, read from stdin."""
+    result = subprocess.run(
+        ["python", "-"],
+        input=python_script,
+        capture_output=True,
+        text=True,
+        cwd=output_dir,
+    )
+    return result.returncode == 0, result.stderr
 
 
 # Centralized plot styling configuration
@@ -58,6 +251,8 @@ PLOT_STYLE = {
     "line_width": 2,
     "marker_size": 12,
     "spine_width": 3,
+    # PDF output (42 embeds TrueType fonts directly instead of converting to Type 3)
+    "pdf_fonttype": 42,
     # Colors
     "ncblue": "#0A2D64",  # Navy blue color from beamer theme
     # Legend styling
@@ -65,33 +260,67 @@ PLOT_STYLE = {
     "legend_framealpha": 0.0,  # Transparent background
 }
 
+# Figure script skeleton; the $ placeholders are filled per figure
+_SCRIPT_TEMPLATE = """
+import numpy as np
+import matplotlib.pyplot as plt
+import matplotlib
+matplotlib.use('Agg')  # Use non-interactive backend
 
-def create_matplotlib_script(
-    user_code: str,
-    block_type: BlockType,
-    output_filename: str,
-    has_columns: bool = False,
-) -> str:
-    """Create complete Python script for matplotlib figure generation."""
+# Configure matplotlib with layout-specific parameters
+plt.figure(figsize=$figsize)
 
-    # Determine figure parameters based on layout
-    if has_columns:
-        figsize = str(PLOT_STYLE["figsize_two_column"])
-    else:
-        figsize = str(PLOT_STYLE["figsize_single_column"])
+# Set font to match beamer (Fira Sans if available, fallback to sans-serif)
+try:
+    plt.rcParams['font.family'] = ['Fira Sans', 'DejaVu Sans', 'sans-serif']
+except:
+    plt.rcParams['font.family'] = 'sans-serif'
+
+plt.rcParams['font.size'] = {font_size}
+plt.rcParams['axes.labelsize'] = {label_size}
+plt.rcParams['xtick.labelsize'] = {tick_size}
+plt.rcParams['ytick.labelsize'] = {tick_size}
+plt.rcParams['legend.fontsize'] = {legend_size}
+plt.rcParams['lines.linewidth'] = {line_width}
+plt.rcParams['lines.markersize'] = {marker_size}
+
+# Set default label positions to axis ends
+plt.rcParams['xaxis.labellocation'] = 'right'
+plt.rcParams['yaxis.labellocation'] = 'top'
+
+# Configure legend styling (no frame by default)
+plt.rcParams['legend.frameon'] = False
+plt.rcParams['legend.framealpha'] = 0.0
+
+# Embed fonts as TrueType, skipping the costly Type 3 conversion
+plt.rcParams['pdf.fonttype'] = {pdf_fonttype}
+
+# User code
+$user_code
 
-    # Extract style parameters
-    font_size = str(PLOT_STYLE["font_size"])
-    label_size = str(PLOT_STYLE["label_size"])
-    tick_size = str(PLOT_STYLE["tick_size"])
-    legend_size = str(PLOT_STYLE["legend_size"])
-    line_width = str(PLOT_STYLE["line_width"])
-    marker_size = str(PLOT_STYLE["marker_size"])
-    spine_width = str(PLOT_STYLE["spine_width"])
-    ncblue = PLOT_STYLE["ncblue"]
-    # Configure schematic vs plot styling
-    if block_type == BlockType.SCHEMATIC:
-        style_config = f"""
+$style_config
+
+# Save figure
+plt.tight_layout()
+plt.savefig('$output_filename', format='pdf', bbox_inches='tight')
+plt.close()
+"""
+
+# Script skeleton with the constant plot style parameters filled in once
+_SCRIPT_BASE = string.Template(_SCRIPT_TEMPLATE.format(
+    font_size=PLOT_STYLE["font_size"],
+    label_size=PLOT_STYLE["label_size"],
+    tick_size=PLOT_STYLE["tick_size"],
+    legend_size=PLOT_STYLE["legend_size"],
+    line_width=PLOT_STYLE["line_width"],
+    marker_size=PLOT_STYLE["marker_size"],
+    pdf_fonttype=PLOT_STYLE["pdf_fonttype"],
+))
+
+
+# Axis styling appended after the user code, per block type
+_STYLE_TEMPLATES = {
+    BlockType.SCHEMATIC: """
 # Configure for schematic (no tick marks, thick axes in navy blue)
 ncblue = '{ncblue}'
 ax = plt.gca()
@@ -109,9 +338,8 @@ ax.yaxis.label.set_color(ncblue)
 # Remove all ticks
 ax.set_xticks([])
 ax.set_yticks([])
-"""
-    else:  # PLOT
-        style_config = f"""
+""",
+    BlockType.PLOT: """
 # Configure for plot (with tick marks, thick axes in navy blue)
 ncblue = '{ncblue}'
 ax = plt.gca()
@@ -128,47 +356,36 @@ ax.yaxis.label.set_color(ncblue)
 
 # Keep tick marks for plots with navy blue color
 plt.tick_params(axis='both', which='major', width=2, length=6, colors=ncblue)
-"""
-
-    script = f"""
-import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
-
-# Configure matplotlib with layout-specific parameters
-plt.figure(figsize={figsize})
-
-# Set font to match beamer (Fira Sans if available, fallback to sans-serif)
-try:
-    plt.rcParams['font.family'] = ['Fira Sans', 'DejaVu Sans', 'sans-serif']
-except:
-    plt.rcParams['font.family'] = 'sans-serif'
-
-plt.rcParams['font.size'] = {font_size}
-plt.rcParams['axes.labelsize'] = {label_size}
-plt.rcParams['xtick.labelsize'] = {tick_size}
-plt.rcParams['ytick.labelsize'] = {tick_size}
-plt.rcParams['legend.fontsize'] = {legend_size}
-plt.rcParams['lines.linewidth'] = {line_width}
-plt.rcParams['lines.markersize'] = {marker_size}
+""",
+}
+_STYLE_CONFIGS = {
+    block_type: template.format(
+        ncblue=PLOT_STYLE["ncblue"], spine_width=PLOT_STYLE["spine_width"]
+    )
+    for block_type, template in _STYLE_TEMPLATES.items()
+}
 
-# Set default label positions to axis ends
-plt.rcParams['xaxis.labellocation'] = 'right'
-plt.rcParams['yaxis.labellocation'] = 'top'
 
-# Configure legend styling (no frame by default)
-plt.rcParams['legend.frameon'] = False
-plt.rcParams['legend.framealpha'] = 0.0
+def create_matplotlib_script(
+    user_code: str,
+    block_type: BlockType,
+    output_filename: str,
+    has_columns: bool = False,
+) -> str:
+    """Create complete Python script for matplotlib figure generation."""
 
-# User code
-{user_code}
+    # Determine figure parameters based on layout
+    if has_columns:
+        figsize = str(PLOT_STYLE["figsize_two_column"])
+    else:
+        figsize = str(PLOT_STYLE["figsize_single_column"])
 
-{style_config}
+    # Schematic vs plot styling; anything but a schematic is styled as a plot
+    style_config = _STYLE_CONFIGS.get(block_type, _STYLE_CONFIGS[BlockType.PLOT])
 
-# Save figure
-plt.tight_layout()
-plt.savefig('{output_filename}', format='pdf', bbox_inches='tight', dpi=300)
-plt.close()
-"""
-    return script
+    return _SCRIPT_BASE.substitute(
+        figsize=figsize,
+        user_code=user_code,
+        style_config=style_config,
+        output_filename=output_filename,
+    )
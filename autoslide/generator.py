@@ -5,28 +5,110 @@ This module contains the main BeamerGenerator class that orchestrates slide gene
 by delegating formatting tasks to specialized modules and providing caching functionality.
 """
 
-import re
 import os
 import sys
 import json
-import hashlib
+import mmap
+import struct
 import tempfile
 import subprocess
 import shutil
+from concurrent.futures import ProcessPoolExecutor
 from typing import List, Dict, Tuple
 
 from .models import Block, BlockType
+from .hashing import fast_hasher
 from . import document, text, tables, lists, images, icons, equations, code
 
+try:
+    import orjson
+
+    _HAS_ORJSON = True
+except ImportError:
+    _HAS_ORJSON = False
+
+
+def _json_dumps(obj, sort_keys: bool = False) -> bytes:
+    """Serialize to compact JSON bytes, with orjson if it is installed."""
+    if _HAS_ORJSON:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+    return json.dumps(obj, sort_keys=sort_keys, separators=(",", ":")).encode("utf-8")
+
+
+# Cache file records: kind byte, key and value lengths, then the UTF-8 key
+# and value
+_CACHE_ENTRY_HEADER = struct.Struct("<cII")
+_SLIDE_ENTRY = b"s"
+_BLOCK_ENTRY = b"b"
+
+
+def _pack_cache_entry(kind: bytes, key: str, latex_source: str) -> bytes:
+    """Encode one cache file record."""
+    key_bytes = key.encode("utf-8")
+    value_bytes = latex_source.encode("utf-8")
+    return (
+        _CACHE_ENTRY_HEADER.pack(kind, len(key_bytes), len(value_bytes))
+        + key_bytes
+        + value_bytes
+    )
+
+
+# Block types whose LaTeX depends only on the block itself, cached per block
+_CACHED_BLOCK_TYPES = frozenset({BlockType.TEXT, BlockType.TABLE, BlockType.LIST})
+
+# Block types handled at the slide level rather than within a section
+_SKIP_IN_SECTION = frozenset(
+    {BlockType.SLIDE_TITLE, BlockType.FOOTLINE, BlockType.FOOTNOTE}
+)
+
+
+# Encoded block type names, so hashing skips the Enum value lookup
+_BLOCK_TYPE_BYTES = {block_type: block_type.value.encode("utf-8") for block_type in BlockType}
+
+
+def _update_block_hash(hasher, block: Block) -> None:
+    """Stream a block's fields into a hasher.
+
+    Fields are length-prefixed so that their boundaries are unambiguous.
+    """
+    for field in (
+        _BLOCK_TYPE_BYTES[block.type],
+        block.content.encode("utf-8"),
+        _json_dumps(block.metadata or {}, sort_keys=True),
+    ):
+        hasher.update(len(field).to_bytes(8, "little"))
+        hasher.update(field)
+
+
+def _block_hash(block: Block) -> str:
+    """Return the block cache key of a block."""
+    hasher = fast_hasher()
+    _update_block_hash(hasher, block)
+    return hasher.hexdigest()
+
 
 class BeamerGenerator:
     def __init__(self, output_dir=".", no_cache=False):
         self.node_counter = 0
         self.output_dir = output_dir
-        self.cache_file = os.path.join(output_dir, ".autoslide.cache")
+        self.cache_file = os.path.join(output_dir, ".autoslide.cache.v2")
+        self.cache_dir = os.path.join(output_dir, ".autoslide-cache")
         self._slide_cache = None
+        self._block_cache = {}
+        self._new_blocks = {}
+        self._pending_cache_writes = []
         self.no_cache = no_cache
 
+    def __getstate__(self):
+        """Leave the caches behind when pickled for worker processes.
+
+        Workers get the block cache entries of their slide with each task.
+        """
+        state = self.__dict__.copy()
+        state["_slide_cache"] = None
+        state["_block_cache"] = {}
+        return state
+
     def _load_cache(self) -> Dict[str, str]:
         """Load slide cache from disk. Returns empty dict if cache doesn't exist or is corrupted."""
         if self._slide_cache is not None:
@@ -42,66 +124,141 @@ class BeamerGenerator:
             return self._slide_cache
 
         try:
-            with open(self.cache_file, "r", encoding="utf-8") as f:
-                for line in f:
-                    line = line.strip()
-                    if line:
-                        entry = json.loads(line)
-                        self._slide_cache[entry["hash"]] = entry["latex_source"]
-        except (json.JSONDecodeError, KeyError, OSError):
+            with open(self.cache_file, "rb") as f, mmap.mmap(
+                f.fileno(), 0, access=mmap.ACCESS_READ
+            ) as mm:
+                caches = {_SLIDE_ENTRY: self._slide_cache, _BLOCK_ENTRY: self._block_cache}
+                offset = 0
+                while offset < len(mm):
+                    kind, key_len, value_len = _CACHE_ENTRY_HEADER.unpack_from(mm, offset)
+                    offset += _CACHE_ENTRY_HEADER.size
+                    key_end = offset + key_len
+                    value_end = key_end + value_len
+                    if value_end > len(mm):
+                        raise ValueError("truncated cache entry")
+                    caches[kind][mm[offset:key_end].decode("utf-8")] = mm[
+                        key_end:value_end
+                    ].decode("utf-8")
+                    offset = value_end
+        except (ValueError, KeyError, OSError, struct.error):
             # Corrupted cache - drop everything and start fresh
             self._slide_cache = {}
+            self._block_cache = {}
 
         return self._slide_cache
 
     def _save_to_cache(self, cache_hash: str, latex_source: str) -> None:
-        """Save a cache entry to disk."""
+        """Save a cache entry; it is written to disk by flush_cache."""
+        self._pending_cache_writes.append(
+            _pack_cache_entry(_SLIDE_ENTRY, cache_hash, latex_source)
+        )
+        # Update in-memory cache
+        if self._slide_cache is None:
+            self._slide_cache = {}
+        self._slide_cache[cache_hash] = latex_source
+
+    def flush_cache(self) -> None:
+        """Append all pending cache entries to the cache file in one write."""
+        if not self._pending_cache_writes:
+            return
         try:
-            with open(self.cache_file, "a", encoding="utf-8") as f:
-                entry = {"hash": cache_hash, "latex_source": latex_source}
-                f.write(json.dumps(entry) + "\n")
-            # Update in-memory cache
-            if self._slide_cache is None:
-                self._slide_cache = {}
-            self._slide_cache[cache_hash] = latex_source
+            with open(self.cache_file, "ab") as f:
+                f.write(b"".join(self._pending_cache_writes))
         except OSError:
             # Ignore write errors - caching is best effort
             pass
+        self._pending_cache_writes = []
 
     def _hash_blocks(self, blocks: List[Block]) -> str:
         """Generate a deterministic hash for a list of blocks."""
-        # Convert blocks to a deterministic JSON representation
-        block_data = []
+        hasher = fast_hasher()
         for block in blocks:
-            block_dict = {
-                "type": block.type.value,
-                "content": block.content,
-                "metadata": block.metadata or {},
-            }
-            block_data.append(block_dict)
-
-        # Sort metadata keys for deterministic output
-        def sort_dict(obj):
-            if isinstance(obj, dict):
-                return {k: sort_dict(obj[k]) for k in sorted(obj.keys())}
-            return obj
-
-        sorted_data = [sort_dict(block) for block in block_data]
-        json_str = json.dumps(sorted_data, sort_keys=True, separators=(",", ":"))
-        return hashlib.sha256(json_str.encode("utf-8")).hexdigest()
+            _update_block_hash(hasher, block)
+        return hasher.hexdigest()
 
     def generate_beamer(
-        self, slides: List[List[Block]], title: str = "Presentation"
+        self,
+        slides: List[List[Block]],
+        title: str = "Presentation",
+        max_workers: int = 1,
     ) -> str:
-        """Generate LaTeX beamer code from parsed slides."""
+        """Generate LaTeX beamer code from parsed slides.
+
+        Slides missing from the cache are rendered in a process pool when
+        max_workers is not 1 (None uses all available CPUs).
+        """
         latex_parts = []
 
-        # Document header
-        latex_parts.append(document.generate_header(title))
+        # Document header, with the Pygments style only if there is code
+        has_code = any(
+            block.type == BlockType.CODE for slide in slides for block in slide
+        )
+        latex_parts.append(document.generate_header(title, use_pygments=has_code))
+
+        # Look up cached slides, collecting the unique misses
+        cache = self._load_cache()
+        hashes = [self._hash_blocks(slide) for slide in slides]
+        rendered = {}
+        missing = {}
+        for cache_hash, slide in zip(hashes, slides):
+            if cache_hash in cache:
+                rendered[cache_hash] = cache[cache_hash]
+            else:
+                missing.setdefault(cache_hash, slide)
+
+        # Cache miss - generate the slides, in parallel if requested
+        if missing:
+            # Highlight all code blocks up front, one Pygments pass per language
+            code.format_code_batch(
+                [
+                    (block.content, block.metadata.get("language", "text"))
+                    for slide in missing.values()
+                    for block in slide
+                    if block.type == BlockType.CODE
+                ],
+                None if self.no_cache else self.cache_dir,
+            )
+
+            # Measure annotated equations concurrently before rendering
+            equations.measure_equations_batch(
+                self._annotated_equations(missing.values()),
+                self.output_dir,
+                None if self.no_cache else self.cache_dir,
+                max_workers,
+            )
 
-        # Process each slide
-        for slide in slides:
-            slide_latex = self._generate_slide(slide)
+            if max_workers != 1 and len(missing) > 1:
+                block_caches = [
+                    self._block_cache_for(slide) for slide in missing.values()
+                ]
+                with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                    results = list(
+                        executor.map(
+                            self._render_slide_with_blocks,
+                            missing.values(),
+                            block_caches,
+                        )
+                    )
+            else:
+                results = [
+                    self._render_slide_with_blocks(slide) for slide in missing.values()
+                ]
+
+            block_entries = {}
+            for cache_hash, (latex_source, new_blocks) in zip(missing.keys(), results):
+                rendered[cache_hash] = latex_source
+                self._save_to_cache(cache_hash, latex_source)
+                block_entries.update(new_blocks)
+            self._block_cache.update(block_entries)
+            self._pending_cache_writes.extend(
+                _pack_cache_entry(_BLOCK_ENTRY, block_hash, latex_source)
+                for block_hash, latex_source in block_entries.items()
+            )
+            self.flush_cache()
+
+        # Process each slide in original order
+        for cache_hash in hashes:
+            slide_latex = rendered[cache_hash]
             if slide_latex:  # Only add non-empty slides
                 latex_parts.append(slide_latex)
 
@@ -110,28 +267,55 @@ class BeamerGenerator:
 
         return "\n".join(latex_parts)
 
-    def _split_blocks_into_sections(self, blocks: List[Block]) -> List[List[Block]]:
-        """Split blocks into sections separated by COLUMN_SECTION_BREAK."""
+    def _annotated_equations(
+        self, slides: List[List[Block]]
+    ) -> List[Tuple[Block, bool]]:
+        """Collect (block, has_columns) for annotated equations on visible content slides."""
+        equation_blocks = []
+        for blocks in slides:
+            if any(
+                block.type in (BlockType.TITLE_PAGE, BlockType.SECTION)
+                or (
+                    block.type == BlockType.SLIDE_TITLE
+                    and block.metadata.get("hide_slide", False)
+                )
+                for block in blocks
+            ):
+                continue
+            for section, has_columns in self._split_blocks_into_sections(blocks):
+                for block in section:
+                    if block.type == BlockType.ANNOTATED_EQUATION:
+                        equation_blocks.append((block, has_columns))
+        return equation_blocks
+
+    def _split_blocks_into_sections(
+        self, blocks: List[Block]
+    ) -> List[Tuple[List[Block], bool]]:
+        """Split blocks into sections separated by COLUMN_SECTION_BREAK.
+
+        Returns (section_blocks, has_columns) tuples, where has_columns tells
+        whether the section contains a COLUMN_BREAK.
+        """
         sections = []
         current_section = []
+        has_columns = False
 
         for block in blocks:
             if block.type == BlockType.COLUMN_SECTION_BREAK:
                 # End current section and start new one
-                sections.append(current_section)
+                sections.append((current_section, has_columns))
                 current_section = []
+                has_columns = False
             else:
+                if block.type == BlockType.COLUMN_BREAK:
+                    has_columns = True
                 current_section.append(block)
 
         # Add final section
-        sections.append(current_section)
+        sections.append((current_section, has_columns))
 
         return sections
 
-    def _section_has_columns(self, section_blocks: List[Block]) -> bool:
-        """Check if a section has column breaks."""
-        return any(block.type == BlockType.COLUMN_BREAK for block in section_blocks)
-
     def _process_slide_blocks(
         self,
         blocks: List[Block],
@@ -142,13 +326,11 @@ class BeamerGenerator:
         """Process blocks for slide content with section-aware column handling."""
         sections = self._split_blocks_into_sections(blocks)
 
-        for i, section in enumerate(sections):
+        for i, (section, section_has_columns) in enumerate(sections):
             # Skip empty sections
             if not section:
                 continue
 
-            section_has_columns = self._section_has_columns(section)
-
             # End previous section's columns environment if this isn't the first section
             if i > 0:
                 slide_parts.append("\\end{column}")
@@ -179,11 +361,7 @@ class BeamerGenerator:
     ) -> None:
         """Process blocks within a single section."""
         for block in blocks:
-            if block.type in [
-                BlockType.SLIDE_TITLE,
-                BlockType.FOOTLINE,
-                BlockType.FOOTNOTE,
-            ]:
+            if block.type in _SKIP_IN_SECTION:
                 continue
             elif block.type == BlockType.SECTION:
                 slide_parts.append(f"\\section{{{block.content}}}")
@@ -213,23 +391,32 @@ class BeamerGenerator:
         slide_parts.append("\\end{frame}")
         slide_parts.append("")  # Empty line between slides
 
-    def _generate_slide(self, blocks: List[Block]) -> str:
-        """Generate LaTeX for a single slide with caching."""
-        # Generate hash for this slide
-        cache_hash = self._hash_blocks(blocks)
-
-        # Check cache first
-        cache = self._load_cache()
-        if cache_hash in cache:
-            return cache[cache_hash]
+    def render_slide(self, blocks: List[Block]) -> str:
+        """Generate LaTeX for a single slide, bypassing the cache."""
+        return self._generate_slide_uncached(blocks)
 
-        # Cache miss - generate the slide
-        latex_source = self._generate_slide_uncached(blocks)
-
-        # Save to cache
-        self._save_to_cache(cache_hash, latex_source)
-
-        return latex_source
+    def _block_cache_for(self, blocks: List[Block]) -> Dict[str, str]:
+        """Return the block cache entries of the given blocks."""
+        block_cache = {}
+        for block in blocks:
+            if block.type in _CACHED_BLOCK_TYPES:
+                block_hash = _block_hash(block)
+                if block_hash in self._block_cache:
+                    block_cache[block_hash] = self._block_cache[block_hash]
+        return block_cache
+
+    def _render_slide_with_blocks(
+        self, blocks: List[Block], block_cache: Dict[str, str] = None
+    ) -> Tuple[str, Dict[str, str]]:
+        """Render a slide, also returning the block cache entries it added.
+
+        A worker process passes the block cache entries of the slide, as the
+        block cache itself is not sent along.
+        """
+        if block_cache is not None:
+            self._block_cache = block_cache
+        self._new_blocks = {}
+        return self.render_slide(blocks), self._new_blocks
 
     def _generate_slide_uncached(self, blocks: List[Block]) -> str:
         """Generate LaTeX for a single slide."""
@@ -238,10 +425,14 @@ class BeamerGenerator:
         slide_metadata = {}
         footline_content = ""
         footnotes = []
+        has_code_block = False
 
-        # Extract slide title, footline, and footnotes
+        # Extract slide title, footline, and footnotes, and check if the slide
+        # contains code blocks (needs fragile option for Verbatim)
         for block in blocks:
-            if block.type == BlockType.SLIDE_TITLE:
+            if block.type == BlockType.CODE:
+                has_code_block = True
+            elif block.type == BlockType.SLIDE_TITLE:
                 slide_title = block.content
                 slide_metadata = block.metadata
             elif block.type == BlockType.TITLE_PAGE:
@@ -265,9 +456,6 @@ class BeamerGenerator:
                 blocks, slide_title, footline_content
             )
 
-        # Check if slide contains code blocks (needs fragile option for Verbatim)
-        has_code_block = any(block.type == BlockType.CODE for block in blocks)
-
         # Start normal frame with [t] option for top alignment
         frame_options = "[t]"
         if has_code_block:
@@ -294,7 +482,9 @@ class BeamerGenerator:
         # Finalize slide
         self._finalize_slide(slide_parts, footnotes)
 
-        return "\n".join(part.rstrip() for part in slide_parts)
+        # Trailing whitespace must go (text blocks end in a newline); rstrip
+        # returns parts without any unchanged, and join takes a list directly
+        return "\n".join([part.rstrip() for part in slide_parts])
 
     def _generate_title_page_slide(self, blocks: List[Block]) -> str:
         """Generate a title page slide with blue bar and no page number."""
@@ -453,10 +643,27 @@ class BeamerGenerator:
         return "\n".join(slide_parts)
 
     def _format_block(self, block: Block, has_columns: bool = False) -> str:
+        """Format a single block, reusing cached LaTeX where possible."""
+        if block.type not in _CACHED_BLOCK_TYPES:
+            return self._format_block_uncached(block, has_columns)
+
+        block_hash = _block_hash(block)
+        latex_output = self._block_cache.get(block_hash)
+        if latex_output is None:
+            latex_output = self._format_block_uncached(block, has_columns)
+            self._block_cache[block_hash] = latex_output
+            self._new_blocks[block_hash] = latex_output
+        return latex_output
+
+    def _format_block_uncached(self, block: Block, has_columns: bool = False) -> str:
         """Format a single block based on its type."""
         if block.type == BlockType.ANNOTATED_EQUATION:
             latex_output, self.node_counter = equations.format_annotated_equation(
-                block, has_columns, self.node_counter, self.output_dir
+                block,
+                has_columns,
+                self.node_counter,
+                self.output_dir,
+                None if self.no_cache else self.cache_dir,
             )
             return latex_output
         elif block.type == BlockType.TABLE:
@@ -471,7 +678,11 @@ class BeamerGenerator:
             return f"\\footnote[{block.metadata['number']}]{{{block.content}}}"
         elif block.type == BlockType.CODE:
             language = block.metadata.get("language", "text")
-            return code.format_code(block.content, language)
+            return code.format_code(
+                block.content,
+                language,
+                None if self.no_cache else self.cache_dir,
+            )
         elif block.type == BlockType.TEXT:
             return text.format_text(block.content)
         else:
@@ -500,14 +711,14 @@ class BeamerGenerator:
         # Add starred footnotes first (no markers, just the content in gray)
         for footnote in starred_footnotes:
             # Apply italic formatting to footnote content
-            content = re.sub(r"\*([^*]+)\*", r"\\textit{\1}", footnote.content)
+            content = text.format_italic(footnote.content)
             footnote_parts.append(f"\\textcolor{{gray}}{{{content}}}")
 
         # Add numbered footnotes with blue markers and pipes, gray text
         for footnote in numbered_footnotes:
             number = footnote.metadata.get("number", "")
             # Apply italic formatting to footnote content
-            content = re.sub(r"\*([^*]+)\*", r"\\textit{\1}", footnote.content)
+            content = text.format_italic(footnote.content)
             footnote_parts.append(
                 f"\\textcolor{{ncblue}}{{{number}}}\\textcolor{{ncblue}}{{|}}~\\textcolor{{gray}}{{{content}}}"
             )
@@ -0,0 +1,31 @@
+import hashlib
+from typing import Union
+
+try:
+    import xxhash
+
+    _HAS_XXHASH = True
+except ImportError:
+    _HAS_XXHASH = False
+
+
+def fast_hash(data: Union[str, bytes]) -> str:
+    """Return a fast, non-cryptographic hex digest of a string for cache keys.
+
+    Uses xxh3 if the optional xxhash package is installed, blake2b otherwise.
+    Strings are hashed as UTF-8; bytes are hashed as-is.
+    """
+    encoded = data.encode("utf-8") if isinstance(data, str) else data
+    if _HAS_XXHASH:
+        return xxhash.xxh3_128_hexdigest(encoded)
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+
+def fast_hasher():
+    """Return a new incremental hasher matching fast_hash.
+
+    The object supports update(bytes) and hexdigest().
+    """
+    if _HAS_XXHASH:
+        return xxhash.xxh3_128()
+    return hashlib.blake2b(digest_size=16)
@@ -1,6 +1,20 @@
 import os
 import sys
 import re
+import shutil
+import tempfile
+import functools
+
+from .hashing import fast_hash
+
+# Icon syntax in headings, e.g. :globe:
+_ICON_RE = re.compile(r":([a-zA-Z0-9_-]+):")
+
+# Stroke and fill colours in SVG sources, except "none"
+_STROKE_DQ_RE = re.compile(r'stroke="(?!none)[^"]*"')
+_STROKE_SQ_RE = re.compile(r"stroke='(?!none)[^']*'")
+_FILL_DQ_RE = re.compile(r'fill="(?!none)[^"]*"')
+_FILL_SQ_RE = re.compile(r"fill='(?!none)[^']*'")
 
 
 def process_heading_icons(heading_text: str, output_dir: str = ".") -> str:
@@ -9,20 +23,22 @@ def process_heading_icons(heading_text: str, output_dir: str = ".") -> str:
     heading_text = heading_text.replace(":email:", ":envelope:")
     heading_text = heading_text.replace(":web:", ":globe:")
 
-    # Pattern to match :icon_name: syntax
-    icon_pattern = r":([a-zA-Z0-9_-]+):"
-
     def replace_icon(match):
         icon_name = match.group(1)
         return generate_svg_icon(icon_name, output_dir)
 
-    return re.sub(icon_pattern, replace_icon, heading_text)
+    return _ICON_RE.sub(replace_icon, heading_text)
 
 
 def generate_svg_icon(icon_name: str, output_dir: str = ".") -> str:
     """Generate LaTeX code for an SVG icon with colored circle background."""
-    import os
+    # Convert output_dir to absolute path to ensure PDFs are created in the right place
+    return _render_icon(icon_name, "#0A2D64", os.path.abspath(output_dir))  # ncblue color
 
+
+@functools.lru_cache(maxsize=None)
+def _render_icon(icon_name: str, color: str, abs_output_dir: str) -> str:
+    """Convert an icon to PDF once per process and return its TikZ code."""
     # Get the directory where render.py is located
     render_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     # Construct the source path relative to render.py
@@ -30,25 +46,24 @@ def generate_svg_icon(icon_name: str, output_dir: str = ".") -> str:
         render_dir, "icons", "light", f"{icon_name}-light.svg"
     )
 
-    # Check if the source file exists
-    if not os.path.exists(source_icon_path):
-        # If icon doesn't exist, return the original text or a placeholder
+    # Read the source file; if the icon doesn't exist, return the original text
+    try:
+        with open(source_icon_path, "rb") as f:
+            svg_bytes = f.read()
+    except OSError:
         return f":{icon_name}:"
 
     # Destination PDF path in output directory
     local_pdf_filename = f"{icon_name}-light.pdf"
-    # Convert output_dir to absolute path to ensure PDFs are created in the right place
-    abs_output_dir = os.path.abspath(output_dir)
     local_pdf_path = os.path.join(abs_output_dir, local_pdf_filename)
 
-    # Convert SVG to PDF if it doesn't exist or source is newer
-    if not os.path.exists(local_pdf_path) or source_is_newer(
-        source_icon_path, local_pdf_path
-    ):
+    # Converted PDFs are cached by SVG content and color
+    cache_key = fast_hash(svg_bytes + b"\0" + color.encode("utf-8"))
+    cache_path = os.path.join(abs_output_dir, ".autoslide-cache", f"icon-{cache_key}.pdf")
+
+    if not _copy_cached_icon(cache_path, local_pdf_path):
         try:
-            convert_svg_to_pdf(
-                source_icon_path, local_pdf_path, "#0A2D64"
-            )  # ncblue color
+            convert_svg_to_pdf(source_icon_path, local_pdf_path, color)
         except Exception as e:
             # If conversion fails, fall back to original text
             print(
@@ -56,6 +71,7 @@ def generate_svg_icon(icon_name: str, output_dir: str = ".") -> str:
                 file=sys.stderr,
             )
             return f":{icon_name}:"
+        _store_cached_icon(local_pdf_path, cache_path)
 
     # Generate TikZ code for icon with circular background using local PDF
     # Use proper LaTeX formatting with inline TikZ and includegraphics for PDF
@@ -66,16 +82,35 @@ def generate_svg_icon(icon_name: str, output_dir: str = ".") -> str:
     return tikz_code
 
 
-def source_is_newer(source_file: str, target_file: str) -> bool:
-    """Check if source file is newer than target file."""
-    import os
+def _copy_cached_icon(cache_path: str, pdf_path: str) -> bool:
+    """Copy a cached icon PDF into place, returning False on a cache miss."""
+    try:
+        shutil.copyfile(cache_path, pdf_path)
+    except OSError:
+        return False
+    return True
+
+
+def _store_cached_icon(pdf_path: str, cache_path: str) -> None:
+    """Store a converted icon PDF in the cache (best effort).
 
+    Each writer copies to its own temporary file, as slide workers may
+    convert the same icon at the same time.
+    """
+    temp_path = None
     try:
-        source_stat = os.stat(source_file)
-        target_stat = os.stat(target_file)
-        return source_stat.st_mtime > target_stat.st_mtime
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path), suffix=".tmp")
+        os.close(fd)
+        shutil.copyfile(pdf_path, temp_path)
+        os.replace(temp_path, cache_path)
     except OSError:
-        return True  # If target doesn't exist or error, consider source newer
+        # Ignore write errors - caching is best effort
+        if temp_path is not None:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
 
 
 def convert_svg_to_pdf(svg_path: str, pdf_path: str, color: str) -> None:
@@ -99,22 +134,16 @@ def convert_svg_to_pdf(svg_path: str, pdf_path: str, color: str) -> None:
 
 def apply_color_to_svg(svg_content: str, color: str) -> str:
     """Apply color to SVG content by replacing currentColor and stroke attributes."""
-    import re
-
     # Replace currentColor with the specified color
     svg_content = svg_content.replace("currentColor", color)
 
     # Replace existing stroke colors (but not "none")
-    svg_content = re.sub(
-        r'stroke="(?!none)[^"]*"', f'stroke="{color}"', svg_content
-    )
-    svg_content = re.sub(
-        r"stroke='(?!none)[^']*'", f"stroke='{color}'", svg_content
-    )
+    svg_content = _STROKE_DQ_RE.sub(f'stroke="{color}"', svg_content)
+    svg_content = _STROKE_SQ_RE.sub(f"stroke='{color}'", svg_content)
 
     # Replace existing fill attributes (except "none")
-    svg_content = re.sub(r'fill="(?!none)[^"]*"', f'fill="{color}"', svg_content)
-    svg_content = re.sub(r"fill='(?!none)[^']*'", f"fill='{color}'", svg_content)
+    svg_content = _FILL_DQ_RE.sub(f'fill="{color}"', svg_content)
+    svg_content = _FILL_SQ_RE.sub(f"fill='{color}'", svg_content)
 
     return svg_content
 
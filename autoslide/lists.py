@@ -1,4 +1,4 @@
-import re
+from .text import format_inline, format_italic
 
 
 def format_list(content: str, process_heading_icons=None) -> str:
@@ -13,7 +13,7 @@ def format_list(content: str, process_heading_icons=None) -> str:
     if first_line and not first_line.startswith("-"):
         # First line is a heading
         # Handle italic formatting in heading
-        first_line = re.sub(r"\*([^*]+)\*", r"\\textit{\1}", first_line)
+        first_line = format_italic(first_line)
         # Handle icon syntax in heading if processor provided
         if process_heading_icons:
             first_line = process_heading_icons(first_line)
@@ -32,14 +32,8 @@ def format_list(content: str, process_heading_icons=None) -> str:
 
         if line.startswith("-"):
             item_text = line[1:].strip()
-            # Handle footnote references
-            item_text = re.sub(
-                r"\[\^(\d+)\]",
-                r"\\footnotemark[\1]",
-                item_text,
-            )
-            # Handle italic formatting: *text* -> \textit{text}
-            item_text = re.sub(r"\*([^*]+)\*", r"\\textit{\1}", item_text)
+            # Handle footnote references and italic formatting: *text* -> \textit{text}
+            item_text = format_inline(item_text)
 
             # Check if next lines are sub-items (indented dashes)
             sub_items = []
@@ -52,15 +46,7 @@ def format_list(content: str, process_heading_icons=None) -> str:
                 # Check if it's an indented dash (starts with spaces/tabs followed by dash)
                 if lines[j].startswith(("  -", "\t-", "    -")):
                     sub_item_text = next_line[1:].strip()
-                    sub_item_text = re.sub(
-                        r"\[\^(\d+)\]",
-                        r"\\footnotemark[\1]",
-                        sub_item_text,
-                    )
-                    # Handle italic formatting: *text* -> \textit{text}
-                    sub_item_text = re.sub(
-                        r"\*([^*]+)\*", r"\\textit{\1}", sub_item_text
-                    )
+                    sub_item_text = format_inline(sub_item_text)
                     sub_items.append(sub_item_text)
                     j += 1
                 else:
@@ -21,7 +21,7 @@ class BlockType(Enum):
     CODE = "code"
 
 
-@dataclass
+@dataclass(slots=True)
 class Block:
     type: BlockType
     content: str
@@ -1,205 +1,494 @@
 import re
 import sys
 import os
-from typing import List, Dict, Tuple
+import json
+import functools
+from typing import Iterable, List, Dict, Optional, Tuple
 from tqdm import tqdm
 
 from .models import Block, BlockType
-from . import figures
+from .hashing import fast_hash, fast_hasher
+from . import figures, models
+
+# Line patterns, compiled once for the per-line parsing loop
+_TRAILING_HASHES_RE = re.compile(r"#+$")
+_SLIDE_TITLE_RE = re.compile(r"### (!?)(\??) (.+?) #+")
+_FOOTNOTE_PREFIX_RE = re.compile(r"^\[[\d\*]+\] ")
+_FOOTNOTE_RE = re.compile(r"^\[([^\]]+)\] (.+)")
+_IMAGE_RE = re.compile(r"^::: ([^:]+):(.*)$")
+_CODE_FENCE_RE = re.compile(r"^```(\w+)")
+_LIST_ITEM_RE = re.compile(r"^\s*-\s")
+_TABLE_SEPARATOR_RE = re.compile(r"^\s*\|?[\s\-\|:]+\|?\s*$")
+
+# First characters of the line-level markup handled in _parse_lines
+_MARKUP_STARTS = frozenset("/>#-[:`")
+
+# Section, title page and slide headers, each of which starts a new slide
+_HEADER_PREFIXES = ("## ", "##### ", "### ")
+
+
+@functools.lru_cache(maxsize=1)
+def _parser_fingerprint() -> str:
+    """Hash of the parser and block model sources, so code changes invalidate cached parses."""
+    hasher = fast_hasher()
+    for module_file in (__file__, models.__file__):
+        with open(module_file, "rb") as f:
+            hasher.update(f.read())
+    return hasher.hexdigest()
+
+
+def _slide_source_to_json(entry: dict) -> dict:
+    """Convert the parse result of a slide source to JSON-compatible values."""
+    return {
+        "slides": [
+            [[block.type.value, block.content, block.metadata] for block in slide]
+            for slide in entry["slides"]
+        ],
+        "footnotes": entry["footnotes"],
+        "pending_figures": [
+            dict(figure_info, block_type=figure_info["block_type"].value)
+            for figure_info in entry["pending_figures"]
+        ],
+        "includes": entry["includes"],
+    }
+
+
+def _slide_source_from_json(data: dict) -> dict:
+    """Inverse of _slide_source_to_json."""
+    return {
+        "slides": [
+            [
+                Block(BlockType(block_type), content, metadata)
+                for block_type, content, metadata in slide
+            ]
+            for slide in data["slides"]
+        ],
+        "footnotes": data["footnotes"],
+        "pending_figures": [
+            dict(figure_info, block_type=BlockType(figure_info["block_type"]))
+            for figure_info in data["pending_figures"]
+        ],
+        "includes": [
+            (include_path, content_hash) for include_path, content_hash in data["includes"]
+        ],
+    }
+
+
+def _split_lines(text: str) -> List[str]:
+    """Split text into lines like text.strip().split("\n").
+
+    Windows line endings are normalized first. Only the blank lines at
+    either end are inspected, instead of copying the whole text to strip it.
+    """
+    if "\r\n" in text:
+        text = text.replace("\r\n", "\n")
+    return _trim_lines(text.split("\n"))
+
+
+def _trim_lines(lines: List[str]) -> List[str]:
+    """Drop surrounding whitespace from a list of lines, like str.strip() on their text."""
+    start, end = 0, len(lines)
+    while start < end and not lines[start].strip():
+        start += 1
+    while end > start and not lines[end - 1].strip():
+        end -= 1
+    if start == end:
+        # Like "".split("\n"), so an empty include still ends a block
+        return [""]
+    lines = lines[start:end]
+    lines[0] = lines[0].lstrip()
+    lines[-1] = lines[-1].rstrip()
+    return lines
+
+
+def _opens_fence(line: str) -> bool:
+    """Check whether a stripped line opens a fenced block that _parse_lines consumes."""
+    if "plot" in line or "schematic" in line:
+        return line.startswith(("```plot", "```schematic"))
+    return _CODE_FENCE_RE.match(line) is not None
+
+
+def _closes_fence(lines: List[str], start: int, end: int) -> bool:
+    """Check whether lines[start:end] contain the closing line of a fence."""
+    return any(lines[j].strip() == "```" for j in range(start, end))
+
+
+def _split_slide_sources(lines: List[str]) -> List[Tuple[int, int]]:
+    """Split lines into (start, end) ranges, each starting at a header.
+
+    Every header finishes the current slide, so the ranges parse
+    independently. Headers inside fenced blocks do not split.
+    """
+    ranges = []
+    start = 0
+    in_fence = False
+    for i, line in enumerate(lines):
+        line = line.strip()
+        if in_fence:
+            in_fence = line != "```"
+        elif line.startswith(_HEADER_PREFIXES):
+            if i > start:
+                ranges.append((start, i))
+            start = i
+        elif line.startswith("```"):
+            in_fence = _opens_fence(line)
+    if len(lines) > start:
+        ranges.append((start, len(lines)))
+    return ranges
 
 
 class MarkdownBeamerParser:
-    def __init__(self, input_filename=None, output_dir="."):
+    def __init__(self, input_filename=None, output_dir=".", no_cache=False):
         self.blocks = []
         self.footnotes = {}
         self.current_slide_blocks = []
         self.slides = []
-        self.figure_counter = 0
         self.input_filename = input_filename
         self.output_dir = output_dir
         self.pending_figures = []  # Store figure info for later generation
+        self._unnamed_figures = []  # (figure info, image block) on the current slide
+        self.cache_dir = os.path.join(output_dir, ".autoslide-cache")
+        self.no_cache = no_cache
+        self.includes = []  # (path, content hash or None) of each include read
 
     def parse(self, markdown_text: str) -> List[List[Block]]:
         """Parse markdown text and return list of slides, each containing blocks."""
-        lines = markdown_text.strip().split("\n")
-        current_block_lines = []
+        return self._parse_lines(_split_lines(markdown_text))
+
+    def parse_stream(self, stream: Iterable[str]) -> List[List[Block]]:
+        """Parse markdown read line by line from a file-like object."""
+        # Trim like parse(), so both entry points see the same lines
+        return self._parse_lines(_trim_lines([line.rstrip("\n") for line in stream]))
+
+    def _parse_lines(self, lines: List[str]) -> List[List[Block]]:
+        """Parse markdown lines and return list of slides, each containing blocks.
+
+        The input is split into slide sources at section, slide and title page
+        headers. Each source's parse is cached on disk, keyed by its lines, so
+        after an edit only the changed slides are reparsed. A cached parse is
+        reused as long as none of the files it included changed.
+        """
+        index_path = None
+        cached_sources = {}
+        if not self.no_cache:
+            index_path = self._parse_index_path()
+            cached_sources = self._load_parse_index(index_path)
+
+        # Cached sources stay in their JSON form unless they are used
+        sources = {}
+        for start, end in _split_slide_sources(lines):
+            key = self._slide_source_key(lines, start, end)
+            data = cached_sources.get(key)
+            entry = None
+            if data is not None:
+                entry = self._cached_slide_source(data)
+            if entry is None:
+                entry = self._parse_slide_source(lines, start, end)
+                data = _slide_source_to_json(entry)
+            self._add_slide_source(entry)
+            sources[key] = data
+
+        if index_path is not None:
+            self._store_parse_index(index_path, sources)
 
-        i = 0
-        while i < len(lines):
-            line = lines[i].strip()
+        # Generate all pending figures now that we know each slide's layout
+        self._generate_all_pending_figures()
 
-            # Skip comment lines (starting with //)
-            if line.startswith("//"):
-                i += 1
-                continue
+        return self.slides
 
-            # Handle include lines (starting with >#)
-            if line.startswith("># "):
-                include_path = line[3:].strip()
-                try:
-                    include_content = self._read_include_file(include_path)
-                    # Insert the content lines at current position
-                    include_lines = include_content.strip().split("\n")
-                    lines[i : i + 1] = (
-                        include_lines  # Replace current line with include content
-                    )
-                    # Don't increment i since we want to process the first included line
+    def _parse_index_path(self) -> str:
+        """Return the cache file holding the parsed slide sources of this input."""
+        key = fast_hash(repr(self.input_filename))
+        return os.path.join(self.cache_dir, f"parse-{key}.json")
+
+    def _slide_source_key(self, lines: List[str], start: int, end: int) -> str:
+        """Return the cache key of the slide source lines[start:end]."""
+        hasher = fast_hasher()
+        for line in lines[start:end]:
+            hasher.update(line.encode("utf-8") + b"\n")
+        return hasher.hexdigest()
+
+    def _parse_slide_source(self, lines: List[str], start: int, end: int) -> dict:
+        """Parse lines[start:end] on their own and return the result."""
+        state = (self.slides, self.footnotes, self.pending_figures, self.includes)
+        self.slides, self.footnotes, self.pending_figures, self.includes = [], {}, [], []
+        try:
+            self._parse_lines_uncached(lines, start, end)
+            entry = {
+                "slides": self.slides,
+                "footnotes": self.footnotes,
+                "pending_figures": self.pending_figures,
+                "includes": self.includes,
+            }
+        finally:
+            self.slides, self.footnotes, self.pending_figures, self.includes = state
+        return entry
+
+    def _add_slide_source(self, entry: dict) -> None:
+        """Append the parse result of one slide source."""
+        self.slides.extend(entry["slides"])
+        self.footnotes.update(entry["footnotes"])
+        self.pending_figures.extend(entry["pending_figures"])
+        self.includes.extend(entry["includes"])
+
+    def _cached_slide_source(self, data: dict) -> Optional[dict]:
+        """Decode a cached slide source, or return None if it is stale or invalid."""
+        try:
+            if not self._includes_unchanged(data["includes"]):
+                return None
+            return _slide_source_from_json(data)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            return None
+
+    def _includes_unchanged(self, includes: List[Tuple[str, Optional[str]]]) -> bool:
+        """Check that the included files still have the recorded content."""
+        return all(
+            self._include_hash(include_path) == content_hash
+            for include_path, content_hash in includes
+        )
+
+    def _load_parse_index(self, index_path: str) -> Dict[str, dict]:
+        """Load the cached slide sources as JSON data, or an empty dict if unavailable."""
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            if index["fingerprint"] != _parser_fingerprint():
+                return {}
+            return dict(index["sources"])
+        except (OSError, KeyError, TypeError, ValueError):
+            return {}
+
+    def _store_parse_index(self, index_path: str, sources: Dict[str, dict]) -> None:
+        """Store the parsed slide sources in the cache (best effort).
+
+        Only the sources of this build are kept, so stale slides are dropped.
+        """
+        index = {"fingerprint": _parser_fingerprint(), "sources": sources}
+        temp_path = index_path + ".tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(index, f)
+            os.replace(temp_path, index_path)
+        except OSError:
+            # Ignore write errors - caching is best effort
+            pass
+
+    @staticmethod
+    def _include_hash(include_path: str) -> Optional[str]:
+        """Hash an include file's content, or None if it cannot be read."""
+        try:
+            with open(include_path, "r", encoding="utf-8") as f:
+                return fast_hash(f.read())
+        except (OSError, UnicodeDecodeError):
+            return None
+
+    def _parse_lines_uncached(
+        self, lines: List[str], start: int = 0, end: Optional[int] = None
+    ) -> None:
+        """Parse lines[start:end] into self.slides and self.pending_figures."""
+        current_block_lines = []
+
+        # Stack of (lines, index, end, include path) frames; an include pushes
+        # the rest of the including file, so included lines are never spliced
+        # into the list
+        frames = [(lines, start, len(lines) if end is None else end, None)]
+        while frames:
+            lines, i, end, source = frames.pop()
+            while i < end:
+                line = lines[i].strip()
+
+                # Plain content lines go straight to the current block
+                if line and line[0] not in _MARKUP_STARTS:
+                    current_block_lines.append(lines[i])
+                    i += 1
                     continue
-                except Exception as e:
-                    # If include fails, treat as comment and skip
-                    print(
-                        f"Warning: Could not include file '{include_path}': {e}",
-                        file=sys.stderr,
-                    )
+
+                # Skip comment lines (starting with //)
+                if line.startswith("//"):
                     i += 1
                     continue
 
-            # Empty line - end current block
-            if not line:
-                if current_block_lines:
-                    self._process_block_lines(current_block_lines)
-                    current_block_lines = []
-                i += 1
-                continue
+                # Handle include lines (starting with >#)
+                if line.startswith("># "):
+                    include_path = line[3:].strip()
+                    try:
+                        include_content = self._read_include_file(include_path)
+                        include_lines = _split_lines(include_content)
+                        # Resume after the include line once the included lines are done
+                        frames.append((lines, i + 1, end, source))
+                        lines, i, end = include_lines, 0, len(include_lines)
+                        source = include_path
+                        continue
+                    except Exception as e:
+                        # If include fails, treat as comment and skip
+                        print(
+                            f"Warning: Could not include file '{include_path}': {e}",
+                            file=sys.stderr,
+                        )
+                        i += 1
+                        continue
+
+                # Empty line - end current block
+                if not line:
+                    if current_block_lines:
+                        self._process_block_lines(current_block_lines)
+                        current_block_lines = []
+                    i += 1
+                    continue
 
-            # Check for section header
-            if line.startswith("## "):
-                if current_block_lines:
-                    self._process_block_lines(current_block_lines)
-                    current_block_lines = []
-                self._finish_current_slide()
-                section_title = line[3:].strip()
-                self.current_slide_blocks.append(
-                    Block(BlockType.SECTION, section_title)
-                )
-                i += 1
-                continue
+                # Check for section header
+                if line.startswith("## "):
+                    if current_block_lines:
+                        self._process_block_lines(current_block_lines)
+                        current_block_lines = []
+                    self._finish_current_slide()
+                    section_title = line[3:].strip()
+                    self.current_slide_blocks.append(
+                        Block(BlockType.SECTION, section_title)
+                    )
+                    i += 1
+                    continue
 
-            # Check for title page (five #)
-            if line.startswith("##### "):
-                if current_block_lines:
-                    self._process_block_lines(current_block_lines)
-                    current_block_lines = []
-                self._finish_current_slide()
+                # Check for title page (five #)
+                if line.startswith("##### "):
+                    if current_block_lines:
+                        self._process_block_lines(current_block_lines)
+                        current_block_lines = []
+                    self._finish_current_slide()
 
-                # Extract title from five # format
-                title = line[6:].strip()  # Remove "##### "
-                title = re.sub(r"#+$", "", title).strip()  # Remove trailing #
+                    # Extract title from five # format
+                    title = line[6:].strip()  # Remove "##### "
+                    title = _TRAILING_HASHES_RE.sub("", title).strip()  # Remove trailing #
 
-                self.current_slide_blocks.append(Block(BlockType.TITLE_PAGE, title))
-                i += 1
-                continue
+                    self.current_slide_blocks.append(Block(BlockType.TITLE_PAGE, title))
+                    i += 1
+                    continue
 
-            # Check for slide title
-            if line.startswith("### "):
-                if current_block_lines:
-                    self._process_block_lines(current_block_lines)
-                    current_block_lines = []
-                self._finish_current_slide()
-
-                # Extract title and check for special markers
-                title_match = re.match(r"### (!?)(\??) (.+?) #+", line)
-                if title_match:
-                    hide_slide = title_match.group(1) == "!"
-                    section_summary = title_match.group(2) == "?"
-                    title = title_match.group(3).strip()
-
-                    metadata = {
-                        "hide_slide": hide_slide,
-                        "section_summary": section_summary,
-                    }
-                    self.current_slide_blocks.append(
-                        Block(BlockType.SLIDE_TITLE, title, metadata)
-                    )
-                else:
-                    # Fallback for simple titles
-                    title = line[4:].strip()
-                    title = re.sub(r"#+$", "", title).strip()
-                    metadata = {"hide_slide": False, "section_summary": False}
-                    self.current_slide_blocks.append(
-                        Block(BlockType.SLIDE_TITLE, title, metadata)
-                    )
-                i += 1
-                continue
+                # Check for slide title
+                if line.startswith("### "):
+                    if current_block_lines:
+                        self._process_block_lines(current_block_lines)
+                        current_block_lines = []
+                    self._finish_current_slide()
+
+                    # Extract title and check for special markers
+                    title_match = _SLIDE_TITLE_RE.match(line)
+                    if title_match:
+                        hide_slide = title_match.group(1) == "!"
+                        section_summary = title_match.group(2) == "?"
+                        title = title_match.group(3).strip()
+
+                        metadata = {
+                            "hide_slide": hide_slide,
+                            "section_summary": section_summary,
+                        }
+                        self.current_slide_blocks.append(
+                            Block(BlockType.SLIDE_TITLE, title, metadata)
+                        )
+                    else:
+                        # Fallback for simple titles
+                        title = line[4:].strip()
+                        title = _TRAILING_HASHES_RE.sub("", title).strip()
+                        metadata = {"hide_slide": False, "section_summary": False}
+                        self.current_slide_blocks.append(
+                            Block(BlockType.SLIDE_TITLE, title, metadata)
+                        )
+                    i += 1
+                    continue
 
-            # Check for column break
-            if line == "-|-":
-                if current_block_lines:
-                    self._process_block_lines(current_block_lines)
-                    current_block_lines = []
-                self.current_slide_blocks.append(Block(BlockType.COLUMN_BREAK, ""))
-                i += 1
-                continue
+                # Check for column break
+                if line == "-|-":
+                    if current_block_lines:
+                        self._process_block_lines(current_block_lines)
+                        current_block_lines = []
+                    self.current_slide_blocks.append(Block(BlockType.COLUMN_BREAK, ""))
+                    i += 1
+                    continue
 
-            # Check for column section break
-            if line == "---":
-                if current_block_lines:
-                    self._process_block_lines(current_block_lines)
-                    current_block_lines = []
-                self.current_slide_blocks.append(Block(BlockType.COLUMN_SECTION_BREAK, ""))
-                i += 1
-                continue
+                # Check for column section break
+                if line == "---":
+                    if current_block_lines:
+                        self._process_block_lines(current_block_lines)
+                        current_block_lines = []
+                    self.current_slide_blocks.append(Block(BlockType.COLUMN_SECTION_BREAK, ""))
+                    i += 1
+                    continue
 
-            # Check for footnote definition (numbered or starred)
-            if re.match(r"^\[[\d\*]+\] ", line):
-                if current_block_lines:
-                    self._process_block_lines(current_block_lines)
-                    current_block_lines = []
-                footnote_match = re.match(r"^\[([^\]]+)\] (.+)", line)
-                if footnote_match:
-                    footnote_num = footnote_match.group(1)
-                    footnote_text = footnote_match.group(2)
-                    self.footnotes[footnote_num] = footnote_text
-                    self.current_slide_blocks.append(
-                        Block(
-                            BlockType.FOOTNOTE, footnote_text, {"number": footnote_num}
+                # Check for footnote definition (numbered or starred)
+                if _FOOTNOTE_PREFIX_RE.match(line):
+                    if current_block_lines:
+                        self._process_block_lines(current_block_lines)
+                        current_block_lines = []
+                    footnote_match = _FOOTNOTE_RE.match(line)
+                    if footnote_match:
+                        footnote_num = footnote_match.group(1)
+                        footnote_text = footnote_match.group(2)
+                        self.footnotes[footnote_num] = footnote_text
+                        self.current_slide_blocks.append(
+                            Block(
+                                BlockType.FOOTNOTE, footnote_text, {"number": footnote_num}
+                            )
                         )
-                    )
-                i += 1
-                continue
+                    i += 1
+                    continue
 
-            # Check for image
-            if line.startswith(":::") and ":" in line[3:]:
-                if current_block_lines:
-                    self._process_block_lines(current_block_lines)
-                    current_block_lines = []
-                # Parse image syntax: "::: filename.svg: Caption"
-                image_match = re.match(r"^::: ([^:]+):(.*)$", line)
-                if image_match:
-                    image_file = image_match.group(1).strip()
-                    caption = image_match.group(2).strip()
-                    self.current_slide_blocks.append(
-                        Block(BlockType.IMAGE, image_file, {"caption": caption})
-                    )
-                i += 1
-                continue
+                # Check for image
+                if line.startswith(":::") and ":" in line[3:]:
+                    if current_block_lines:
+                        self._process_block_lines(current_block_lines)
+                        current_block_lines = []
+                    # Parse image syntax: "::: filename.svg: Caption"
+                    image_match = _IMAGE_RE.match(line)
+                    if image_match:
+                        image_file = image_match.group(1).strip()
+                        caption = image_match.group(2).strip()
+                        self.current_slide_blocks.append(
+                            Block(BlockType.IMAGE, image_file, {"caption": caption})
+                        )
+                    i += 1
+                    continue
 
-            # Check for fenced code blocks (plot/schematic/code)
-            if line.startswith("```"):
-                if current_block_lines:
-                    self._process_block_lines(current_block_lines)
-                    current_block_lines = []
-
-                # Parse fenced code block
-                if "plot" in line or "schematic" in line:
-                    # Handle plot/schematic blocks (generate figures)
-                    plot_block, new_i = self._parse_fenced_code_block(lines, i)
-                    if plot_block:
-                        self.current_slide_blocks.append(plot_block)
-                    i = new_i
-                else:
-                    # Handle generic code blocks (syntax highlighting)
-                    code_block, new_i = self._parse_code_block(lines, i)
-                    if code_block:
-                        self.current_slide_blocks.append(code_block)
-                    i = new_i
-                continue
+                # Check for fenced code blocks (plot/schematic/code)
+                if line.startswith("```"):
+                    if current_block_lines:
+                        self._process_block_lines(current_block_lines)
+                        current_block_lines = []
+
+                    # A fence opened in an included file may be closed by the
+                    # including file, so join the frames below until it is
+                    if source is not None and _opens_fence(line):
+                        fence_line, fence_source = i + 1, source
+                        while not _closes_fence(lines, i + 1, end):
+                            if not frames:
+                                raise ValueError(
+                                    f"Unclosed fenced block starting at line "
+                                    f"{fence_line} of '{fence_source}'"
+                                )
+                            outer_lines, outer_i, outer_end, source = frames.pop()
+                            lines = lines[i:end] + outer_lines[outer_i:outer_end]
+                            i, end = 0, len(lines)
+
+                    # Parse fenced code block
+                    if "plot" in line or "schematic" in line:
+                        # Handle plot/schematic blocks (generate figures)
+                        plot_block, new_i = self._parse_fenced_code_block(lines, i)
+                        if plot_block:
+                            self.current_slide_blocks.append(plot_block)
+                        i = new_i
+                    else:
+                        # Handle generic code blocks (syntax highlighting)
+                        code_block, new_i = self._parse_code_block(lines, i)
+                        if code_block:
+                            self.current_slide_blocks.append(code_block)
+                        i = new_i
+                    continue
 
-            # Collect lines for current block (preserve original spacing)
-            current_block_lines.append(
-                lines[i]
-            )  # Use original line, not stripped version
-            i += 1
+                # Collect lines for current block (preserve original spacing)
+                current_block_lines.append(
+                    lines[i]
+                )  # Use original line, not stripped version
+                i += 1
 
         # Process final block
         if current_block_lines:
@@ -207,11 +496,6 @@ class MarkdownBeamerParser:
 
         self._finish_current_slide()
 
-        # Generate all pending figures now that we know each slide's layout
-        self._generate_all_pending_figures()
-
-        return self.slides
-
     def _parse_fenced_code_block(
         self, lines: List[str], start_i: int
     ) -> Tuple[Block, int]:
@@ -249,29 +533,19 @@ class MarkdownBeamerParser:
 
         # Store figure info for later generation (after we know full slide layout)
         code = "\n".join(code_lines)
-        self.figure_counter += 1
-
-        # Determine base filename
-        if self.input_filename:
-            base_name = os.path.splitext(os.path.basename(self.input_filename))[0]
-        else:
-            base_name = "figure"
-
-        figure_filename = f"{base_name}.figure{self.figure_counter}.pdf"
-
-        # Store figure info for later generation
         figure_info = {
             "code": code,
             "block_type": block_type,
             "caption": caption,
-            "filename": figure_filename,
-            "slide_index": len(self.slides),  # Current slide index
+            "filename": None,  # Set by _name_slide_figures
+            "has_columns": None,
         }
         self.pending_figures.append(figure_info)
 
         # Create image block pointing to future generated figure
         metadata = {"caption": caption, "generated": True}
-        image_block = Block(BlockType.IMAGE, figure_filename, metadata)
+        image_block = Block(BlockType.IMAGE, "", metadata)
+        self._unnamed_figures.append((figure_info, image_block))
 
         return image_block, i + 1
 
@@ -282,7 +556,7 @@ class MarkdownBeamerParser:
         start_line = lines[start_i].strip()
 
         # Extract language: ```lang
-        match = re.match(r"^```(\w+)", start_line)
+        match = _CODE_FENCE_RE.match(start_line)
         if not match:
             return None, start_i + 1
 
@@ -313,35 +587,34 @@ class MarkdownBeamerParser:
 
         print(f"Generating {len(self.pending_figures)} figures...", file=sys.stderr)
 
-        for figure_info in tqdm(
-            self.pending_figures,
+        jobs = []
+        queued = set()  # identical figures share a file
+        for figure_info in self.pending_figures:
+            if figure_info["filename"] in queued:
+                continue
+            queued.add(figure_info["filename"])
+
+            # Queue the figure with correct layout parameters
+            jobs.append(
+                (
+                    figure_info["code"],
+                    figure_info["block_type"],
+                    figure_info["filename"],
+                    figure_info["has_columns"],
+                    self.output_dir,
+                )
+            )
+
+        for _ in tqdm(
+            figures.generate_figures_batch(
+                jobs, None if self.no_cache else self.cache_dir
+            ),
+            total=len(jobs),
             desc="Generating figures",
             unit="figure",
             file=sys.stderr,
         ):
-            slide_index = figure_info["slide_index"]
-
-            # Check if this slide has columns
-            if slide_index < len(self.slides):
-                slide_blocks = self.slides[slide_index]
-                has_columns = any(
-                    block.type == BlockType.COLUMN_BREAK for block in slide_blocks
-                )
-            else:
-                # Figure is on current slide being built
-                has_columns = any(
-                    block.type == BlockType.COLUMN_BREAK
-                    for block in self.current_slide_blocks
-                )
-
-            # Generate the figure with correct layout parameters
-            figures.generate_figure_file(
-                figure_info["code"],
-                figure_info["block_type"],
-                figure_info["filename"],
-                has_columns,
-                self.output_dir,
-            )
+            pass
 
 
     def _process_block_lines(self, lines: List[str]):
@@ -350,6 +623,7 @@ class MarkdownBeamerParser:
             return
 
         content = "\n".join(lines)
+        stripped = [line.strip() for line in lines]
 
         # Check for equation (starts with $$)
         if lines[0].startswith("$$"):
@@ -358,7 +632,7 @@ class MarkdownBeamerParser:
             for i, line in enumerate(lines):
                 # For multiline equations, skip the first line which starts with $$
                 # Only consider a line ending if it's not the first line or if it's a single line equation
-                if line.endswith("$$") and (i > 0 or lines[0].strip() != "$$"):
+                if line.endswith("$$") and (i > 0 or stripped[0] != "$$"):
                     equation_end = i
                     break
 
@@ -384,29 +658,24 @@ class MarkdownBeamerParser:
                 return
 
         # Check for table (markdown table syntax)
-        if self._is_markdown_table(lines):
+        if self._is_markdown_table(stripped):
             self.current_slide_blocks.append(Block(BlockType.TABLE, content))
             return
 
         # Check for list (lines starting with - or numbered, or heading followed by dashes)
-        has_dashes = any(line.strip().startswith("-") for line in lines)
+        has_dashes = any(line.startswith("-") for line in stripped)
 
         # Check for proper heading followed by list items
         # All lines after the first must be either empty or start with optional whitespace + dash + whitespace
         has_proper_heading = False
-        if len(lines) > 1 and not lines[0].strip().startswith("-") and has_dashes:
+        if len(lines) > 1 and not stripped[0].startswith("-") and has_dashes:
             # Check that all lines after the first are either empty or proper list items
-            lines_after_heading = lines[1:]
             has_proper_heading = all(
-                not line.strip() or re.match(r"^\s*-\s", line)
-                for line in lines_after_heading
+                not stripped_line or _LIST_ITEM_RE.match(line)
+                for line, stripped_line in zip(lines[1:], stripped[1:])
             )
 
-        is_all_dashes = all(
-            line.strip().startswith("-") or not line.strip()
-            for line in lines
-            if line.strip()
-        )
+        is_all_dashes = all(line.startswith("-") for line in stripped if line)
 
         if has_dashes and (is_all_dashes or has_proper_heading):
             self.current_slide_blocks.append(Block(BlockType.LIST, content))
@@ -416,29 +685,52 @@ class MarkdownBeamerParser:
         self.current_slide_blocks.append(Block(BlockType.TEXT, content))
 
     def _is_markdown_table(self, lines: List[str]) -> bool:
-        """Check if lines represent a markdown table."""
+        """Check if (already stripped) lines represent a markdown table."""
         if len(lines) < 2:
             return False
 
-        # Look for separator line (second line should contain |---|---|)
-        for i, line in enumerate(lines):
-            line = line.strip()
-            if i == 0:
-                # First line should have pipes
-                if not ("|" in line):
-                    continue
-            elif re.match(r"^\s*\|?[\s\-\|:]+\|?\s*$", line):
-                # This is a separator line, check if previous line had pipes
-                if i > 0 and "|" in lines[i - 1]:
-                    return True
+        # Look for a separator line (|---|---|) below a line with pipes; the
+        # cheap pipe test comes first so plain text never reaches the regex
+        for i in range(1, len(lines)):
+            if "|" in lines[i - 1] and _TABLE_SEPARATOR_RE.match(lines[i]):
+                return True
         return False
 
     def _finish_current_slide(self):
         """Finish current slide and add to slides list."""
         if self.current_slide_blocks:
-            self.slides.append(self.current_slide_blocks.copy())
+            self._name_slide_figures()
+            self.slides.append(self.current_slide_blocks)
             self.current_slide_blocks = []
 
+    def _name_slide_figures(self):
+        """Name the figures of the current slide now that its layout is known.
+
+        Figures are named after everything that affects their rendering, so
+        adding or removing other figures does not rename them.
+        """
+        if not self._unnamed_figures:
+            return
+
+        has_columns = any(
+            block.type == BlockType.COLUMN_BREAK for block in self.current_slide_blocks
+        )
+
+        # Determine base filename
+        if self.input_filename:
+            base_name = os.path.splitext(os.path.basename(self.input_filename))[0]
+        else:
+            base_name = "figure"
+
+        for figure_info, image_block in self._unnamed_figures:
+            figure_hash = fast_hash(
+                f"{figure_info['block_type'].value}\0{has_columns}\0{figure_info['code']}"
+            )[:12]
+            figure_info["filename"] = f"{base_name}.figure.{figure_hash}.pdf"
+            figure_info["has_columns"] = has_columns
+            image_block.content = figure_info["filename"]
+        self._unnamed_figures = []
+
     def _read_include_file(self, include_path: str) -> str:
         """Read and return the content of an include file."""
         import os
@@ -448,5 +740,12 @@ class MarkdownBeamerParser:
             input_dir = os.path.dirname(self.input_filename)
             include_path = os.path.join(input_dir, include_path)
 
-        with open(include_path, "r", encoding="utf-8") as f:
-            return f.read()
\ No newline at end of file
+        # Record every include attempt, so cached parses can be validated
+        try:
+            with open(include_path, "r", encoding="utf-8") as f:
+                content = f.read()
+        except Exception:
+            self.includes.append((include_path, None))
+            raise
+        self.includes.append((include_path, fast_hash(content)))
+        return content
\ No newline at end of file
@@ -1,9 +1,19 @@
 import re
+from io import StringIO
+
+from .text import format_inline
+
+# Separator row (|---|---|)
+_SEPARATOR_RE = re.compile(r"^\s*\|?[\s\-\|:]+\|?\s*$")
+
+# Rules above and below the header row, in the header background color
+_HEADER_RULE_ABOVE = "\\arrayrulecolor{ncblue!20}\\specialrule{1.33pt}{0pt}{0pt}\\arrayrulecolor{black}\n"
+_HEADER_RULE_BELOW = "\\arrayrulecolor{ncblue}\\specialrule{1.33pt}{0pt}{0pt}\\arrayrulecolor{black}\n"
 
 
 def format_table(content: str) -> str:
     """Format markdown table content."""
-    lines = [line.strip() for line in content.split("\n") if line.strip()]
+    lines = [line for line in (line.strip() for line in content.split("\n")) if line]
 
     if len(lines) < 2:
         return content
@@ -11,25 +21,18 @@ def format_table(content: str) -> str:
     # Parse table rows
     table_rows = []
 
-    for i, line in enumerate(lines):
+    for line in lines:
         # Skip separator line (|---|---|)
-        if re.match(r"^\s*\|?[\s\-\|:]+\|?\s*$", line):
+        if _SEPARATOR_RE.match(line):
             continue
 
         # Parse table row
         if "|" in line:
-            # Remove leading/trailing pipes and split
-            cells = [cell.strip() for cell in line.strip("|").split("|")]
-            # Apply italic formatting to each cell
-            cells = [
-                re.sub(r"\*([^*]+)\*", r"\\textit{\1}", cell) for cell in cells
-            ]
-            # Handle footnote references in cells
-            cells = [
-                re.sub(r"\[\^(\d+)\]", r"\\footnotemark[\1]", cell)
-                for cell in cells
-            ]
-            table_rows.append(cells)
+            # Remove leading/trailing pipes and split, then apply italic
+            # formatting and footnote references to each cell
+            table_rows.append(
+                [format_inline(cell.strip()) for cell in line.strip("|").split("|")]
+            )
 
     if not table_rows:
         return content
@@ -38,39 +41,31 @@ def format_table(content: str) -> str:
     max_cols = max(len(row) for row in table_rows)
 
     # Build LaTeX table
-    latex_lines = []
-    latex_lines.append("\\begin{center}")
-    latex_lines.append("\\begin{tabular}{" + "l" * max_cols + "}")
+    latex = StringIO()
+    latex.write("\\begin{center}\n")
+    latex.write("\\begin{tabular}{" + "l" * max_cols + "}\n")
 
     for i, row in enumerate(table_rows):
         # Pad row to max columns
-        padded_row = row + [""] * (max_cols - len(row))
+        if len(row) < max_cols:
+            row += [""] * (max_cols - len(row))
 
         if i == 0:
-            # Add blue line above header matching header background color
-            latex_lines.append(
-                "\\arrayrulecolor{ncblue!20}\\specialrule{1.33pt}{0pt}{0pt}\\arrayrulecolor{black}"
-            )
-            # Header row - blue background and bold text
-            formatted_cells = [f"\\textbf{{{cell}}}" for cell in padded_row]
-            latex_lines.append(
-                "\\rowcolor{ncblue!20}" + " & ".join(formatted_cells) + " \\\\"
-            )
-            # Add thinner blue line under header
-            latex_lines.append(
-                "\\arrayrulecolor{ncblue}\\specialrule{1.33pt}{0pt}{0pt}\\arrayrulecolor{black}"
-            )
+            # Header row - blue background and bold text, between blue lines
+            latex.write(_HEADER_RULE_ABOVE)
+            latex.write("\\rowcolor{ncblue!20}")
+            latex.write(" & ".join([f"\\textbf{{{cell}}}" for cell in row]))
+            latex.write(" \\\\\n")
+            latex.write(_HEADER_RULE_BELOW)
         else:
             # Data rows with alternating shading pattern (2 unshaded, 2 shaded)
             # Pattern: rows 1,2 = unshaded, rows 3,4 = shaded, rows 5,6 = unshaded, etc.
             cycle_position = (i - 1) % 4  # 0,1,2,3 for rows 1,2,3,4
             if cycle_position >= 2:  # rows 3,4 in each cycle get light blue shading
-                latex_lines.append(
-                    "\\rowcolor{ncblue!10}" + " & ".join(padded_row) + " \\\\"
-                )
-            else:
-                latex_lines.append(" & ".join(padded_row) + " \\\\")
+                latex.write("\\rowcolor{ncblue!10}")
+            latex.write(" & ".join(row))
+            latex.write(" \\\\\n")
 
-    latex_lines.append("\\end{tabular}")
-    latex_lines.append("\\end{center}")
-    return "\n".join(latex_lines)
\ No newline at end of file
+    latex.write("\\end{tabular}\n")
+    latex.write("\\end{center}")
+    return latex.getvalue()
@@ -1,11 +1,34 @@
 import re
 
+# Inline markup: italic text or a footnote reference, matched in one pass
+_INLINE_RE = re.compile(r"\*(?P<italic>[^*]+)\*|\[\^(?P<footnote>\d+)\]")
+_FOOTNOTE_REF_RE = re.compile(r"\[\^(\d+)\]")
+_ITALIC_RE = re.compile(r"\*([^*]+)\*")
+
+
+def _replace_inline(match) -> str:
+    """Return the LaTeX for one inline markup match."""
+    footnote = match.group("footnote")
+    if footnote is not None:
+        return f"\\footnotemark[{footnote}]"
+    # Footnote references may also appear inside italic text
+    italic = _FOOTNOTE_REF_RE.sub(r"\\footnotemark[\1]", match.group("italic"))
+    return f"\\textit{{{italic}}}"
+
+
+def format_inline(content: str) -> str:
+    """Convert *italic* text and [^n] footnote references to LaTeX."""
+    return _INLINE_RE.sub(_replace_inline, content)
+
+
+def format_italic(content: str) -> str:
+    """Convert *italic* text to LaTeX, leaving footnote references alone."""
+    return _ITALIC_RE.sub(r"\\textit{\1}", content)
+
 
 def format_text(content: str) -> str:
     """Format text content."""
-    # Handle footnote references
-    content = re.sub(r"\[\^(\d+)\]", r"\\footnotemark[\1]", content)
-    # Handle italic formatting: *text* -> \textit{text}
-    content = re.sub(r"\*([^*]+)\*", r"\\textit{\1}", content)
+    # Handle footnote references and italic formatting: *text* -> \textit{text}
+    content = format_inline(content)
     # Always add empty line after text blocks to preserve paragraph spacing
     return content + "\n"
\ No newline at end of file
@@ -0,0 +1,30 @@
+import unittest
+
+from pygments import highlight
+
+from autoslide import code
+from autoslide._pygments import shared_formatter
+
+
+class FormatCodeBatchTest(unittest.TestCase):
+    def setUp(self):
+        code._code_cache.clear()
+
+    def test_batch_matches_per_block_highlighting(self):
+        """Lexer state of one block must not leak into the next."""
+        blocks = [
+            ("for (int i = 0; i < n; i++) {\n    x += i;", "c"),
+            ("int main() {\n    return 0;\n}", "c"),
+            ('s = """unterminated', "python"),
+            ("def f(x):\n    return x", "python"),
+            ("plain text", "text"),
+        ]
+        code.format_code_batch(blocks)
+
+        for content, language in blocks:
+            expected = highlight(content, code._lexer(language), shared_formatter())
+            self.assertEqual(code.format_code(content, language), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
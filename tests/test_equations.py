@@ -0,0 +1,33 @@
+import os
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+from autoslide import equations
+
+
+class RunMeasurementPassesTest(unittest.TestCase):
+    def test_format_dir_is_absolute(self):
+        """XeLaTeX runs in the scratch directory, so TEXFORMATS must not be relative."""
+        calls = []
+
+        def fake_run(command, **kwargs):
+            calls.append(kwargs)
+            return subprocess.CompletedProcess(command, 0, stdout=b"")
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with mock.patch.object(equations.subprocess, "run", fake_run):
+                equations.run_measurement_passes(
+                    temp_dir, os.path.join("deck-autoslide", ".autoslide-cache"), "measurement"
+                )
+
+        self.assertEqual(len(calls), equations.MEASUREMENT_PASSES)
+        for kwargs in calls:
+            format_dir = kwargs["env"]["TEXFORMATS"]
+            self.assertTrue(format_dir.endswith(os.pathsep))
+            self.assertTrue(os.path.isabs(format_dir[: -len(os.pathsep)]))
+
+
+if __name__ == "__main__":
+    unittest.main()